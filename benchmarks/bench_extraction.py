@@ -0,0 +1,94 @@
+"""Compare the single-pass article extractor against the legacy extract_* functions.
+
+Run from the repository root:  python -m benchmarks.bench_extraction [iterations]
+"""
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from extraction import extract_article, _site_profiles
+from news import ARTICLE_STRAINER
+from benchmarks.legacy_extraction import (
+    extract_article_title, extract_article_date, extract_article_author,
+    extract_article_content, extract_article_image, extract_article_category
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fixture_url(name):
+    """Give each fixture its own site so it learns its own selector profile"""
+    return f"https://{os.path.splitext(name)[0].replace('_', '-')}.fixtures.local/article"
+
+def load_fixtures():
+    """Parse every saved HTML page the same way parse_article_html does"""
+    fixtures = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                soup = BeautifulSoup(f.read(), 'lxml', parse_only=ARTICLE_STRAINER)
+            fixtures.append((fixture_url(name), soup))
+    return fixtures
+
+def extract_legacy(soup, url=None):
+    """Run the legacy selector-chain functions and collect the same fields"""
+    full_content, preview = extract_article_content(soup)
+    return {
+        'title': extract_article_title(soup),
+        'date': extract_article_date(soup),
+        'author': extract_article_author(soup),
+        'content': full_content,
+        'preview': preview,
+        'image_url': extract_article_image(soup),
+        'category': extract_article_category(soup)
+    }
+
+def time_extractor(func, fixtures, iterations):
+    """Total seconds to run func over every fixture `iterations` times"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for url, soup in fixtures:
+            func(soup, url)
+    return time.perf_counter() - start
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"No fixtures found in {FIXTURES_DIR}")
+        return
+
+    print(f"{len(fixtures)} fixtures, {iterations} iterations each\n")
+
+    # Field-by-field comparison (content differs where the legacy paragraph
+    # filter matched single characters of the skip words against class names)
+    for url, soup in fixtures:
+        _site_profiles.clear()
+        legacy = extract_legacy(soup)
+        single = extract_article(soup, url)
+        diffs = [field for field in legacy if legacy[field] != single[field]]
+        print(f"{url}: {'identical' if not diffs else 'differs in ' + ', '.join(diffs)}")
+
+    legacy_time = time_extractor(extract_legacy, fixtures, iterations)
+
+    def run_cold(soup, url):
+        _site_profiles.clear()
+        return extract_article(soup, url)
+    cold_time = time_extractor(run_cold, fixtures, iterations)
+
+    _site_profiles.clear()
+    warm_time = time_extractor(extract_article, fixtures, iterations)
+
+    runs = iterations * len(fixtures)
+    print()
+    for label, elapsed in (
+        ('legacy selector chains', legacy_time),
+        ('single pass, cold profile', cold_time),
+        ('single pass, learned profile', warm_time)
+    ):
+        print(f"{label:<30} {elapsed:8.3f}s total  {elapsed / runs * 1000:7.3f}ms/article  "
+              f"{legacy_time / elapsed:5.2f}x")
+
+if __name__ == '__main__':
+    main()
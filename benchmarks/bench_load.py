@@ -0,0 +1,220 @@
+"""Offline load benchmark for the refresh, leaderboard and live tracker paths.
+
+Starts a local aoe4world stand-in, seeds a temporary players.db with synthetic
+players and drives the task functions against fake guild and channel objects.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bench_load --players 1000 --latency 0.05 --error-rate 0.01 --throttle-every 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_aoe4world import FakeAoe4World
+from benchmarks.fakes import FakeBot, FakeChannel, FakeGuild, FakeRole
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=1000, help="registered accounts to seed (10-10000)")
+    parser.add_argument('--smurf-every', type=int, default=5, help="every Nth account is a smurf of the previous user")
+    parser.add_argument('--guilds', type=int, default=1, help="guilds the accounts are spread across")
+    parser.add_argument('--shared-every', type=int, default=0,
+                        help="every Nth account is also registered in the next guild (0 disables)")
+    parser.add_argument('--absent-rate', type=float, default=0.05, help="fraction of users no longer in the guild")
+    parser.add_argument('--latency', type=float, default=0.05, help="fake API latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02, help="random latency jitter in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API requests answered with 503")
+    parser.add_argument('--throttle-every', type=int, default=0, help="answer every Nth API request with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--rate', type=float, default=1000.0, help="scheduler requests per second (production: 5)")
+    parser.add_argument('--burst', type=int, default=100, help="scheduler burst size")
+    parser.add_argument('--refresh-concurrency', type=int, default=20, help="profiles refreshed at once in the refresh phase")
+    parser.add_argument('--trace-memory', action='store_true', help="also report the Python heap peak (slower)")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's INFO logs")
+    args = parser.parse_args(argv)
+    if not 10 <= args.players <= 10000:
+        parser.error("--players must be between 10 and 10000")
+    if args.guilds < 1:
+        parser.error("--guilds must be at least 1")
+    return args
+
+async def seed_players(db, guilds, args):
+    """Insert synthetic accounts and add their owners to the fake guilds.
+
+    Users are spread round-robin across guilds; with --shared-every some
+    accounts are registered in a second guild too."""
+    rows = []
+    discord_id = 10 ** 17
+    user_index = -1
+    for i in range(args.players):
+        is_main = not (args.smurf_every and i % args.smurf_every == args.smurf_every - 1)
+        if is_main:
+            discord_id += 1
+            user_index += 1
+        guild = guilds[user_index % len(guilds)]
+        ingame_id = str(2000000 + i)
+        rows.append((guild.id, discord_id, ingame_id, f"Player{ingame_id}", "unranked", 0, 0, is_main))
+        if len(guilds) > 1 and args.shared_every and i % args.shared_every == 0:
+            other = guilds[(user_index + 1) % len(guilds)]
+            rows.append((other.id, discord_id, ingame_id, f"Player{ingame_id}", "unranked", 0, 0, is_main))
+    await db.executemany("""
+        INSERT INTO players (guild_id, discord_id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+    guilds_by_id = {guild.id: guild for guild in guilds}
+    memberships = sorted({(row[0], row[1]) for row in rows})
+    absent_every = int(1 / args.absent_rate) if args.absent_rate else 0
+    for index, (guild_id, member_id) in enumerate(memberships):
+        if absent_every and index % absent_every == absent_every - 1:
+            continue
+        guilds_by_id[guild_id].add_member(member_id)
+    return rows
+
+class PhaseReport:
+    def __init__(self, server):
+        self.server = server
+        self.rows = []
+
+    async def run(self, name, coro_factory):
+        before = self.server.snapshot()
+        ids_before = self.server.profile_ids_requested
+        start = time.perf_counter()
+        result = await coro_factory()
+        elapsed = time.perf_counter() - start
+        delta = self.server.snapshot()
+        delta.subtract(before)
+        self.rows.append((name, elapsed, +delta, self.server.profile_ids_requested - ids_before))
+        return result
+
+    def print(self):
+        print(f"{'phase':<28} {'wall':>9} {'requests':>9} {'ids':>7}  breakdown")
+        for name, elapsed, requests, ids in self.rows:
+            breakdown = ", ".join(f"{endpoint} {status}: {count}" for (endpoint, status), count in sorted(requests.items()))
+            print(f"{name:<28} {elapsed:8.2f}s {sum(requests.values()):>9} {ids:>7}  {breakdown or '-'}")
+
+async def run(args):
+    server = FakeAoe4World(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_every=args.throttle_every, retry_after=args.retry_after
+    )
+    await server.start()
+    # Must be set before the bot modules import config
+    os.environ['AOE4WORLD_API_ROOT'] = server.api_root
+
+    from config import RANK_ROLES
+    from database import AOE4Database, WriteBehindBuffer
+    from http_client import HTTPSession
+    from scheduler import RequestScheduler
+    from cache import ProfileCache
+    from game_tracker import GameTracker
+    from guilds import GuildConfig, GuildConfigStore
+    from utils import reconcile_rank_roles
+    from tasks import refresh_player_profile, update_leaderboards, update_active_players
+
+    with tempfile.TemporaryDirectory(prefix='aoe4bench-') as tmp:
+        db = AOE4Database(os.path.join(tmp, 'players.db'))
+        http_session = HTTPSession()
+        await http_session.start()
+        scheduler = RequestScheduler(http_session, rate=args.rate, burst=args.burst)
+
+        # Each guild gets its own rank roles and rank / log / leaderboard / live channels
+        guilds, channels = [], []
+        guild_configs = GuildConfigStore(db)
+        for n in range(args.guilds):
+            guild_id = 1 + n
+            role_offset = n * 1000
+            guild = FakeGuild(guild_id, [FakeRole(role_id + role_offset, rank) for rank, role_id in RANK_ROLES.items()])
+            guild_channels = [FakeChannel(guild_id * 10 + kind, guild) for kind in range(4)]
+            guilds.append(guild)
+            channels.extend(guild_channels)
+            await guild_configs.save(GuildConfig(
+                guild_id,
+                rank_channel_id=guild_channels[0].id,
+                log_channel_id=guild_channels[1].id,
+                leaderboard_channel_id=guild_channels[2].id,
+                active_players_channel_id=guild_channels[3].id,
+                rank_roles={rank: role_id + role_offset for rank, role_id in RANK_ROLES.items()}
+            ))
+        bot = FakeBot(
+            db, WriteBehindBuffer(db), http_session, scheduler, ProfileCache(), GameTracker(db),
+            guild_configs, guilds, channels
+        )
+        rows = await seed_players(db, guilds, args)
+        members = sum(len(guild.members) for guild in guilds)
+        print(f"Seeded {len(rows)} registrations ({args.players} accounts) for {members} members in {len(guilds)} guilds; "
+              f"fake API at {server.api_root} (latency {args.latency}s, errors {args.error_rate:.0%}, "
+              f"429 every {args.throttle_every or 'never'})\n")
+
+        report = PhaseReport(server)
+
+        async def full_refresh():
+            registrations = {}
+            for guild_id, discord_id, ingame_id, _, rank_level, _, _, is_main in rows:
+                if bot.get_guild(guild_id).get_member(discord_id):
+                    registrations.setdefault(ingame_id, []).append((guild_id, discord_id, rank_level, is_main))
+            semaphore = asyncio.Semaphore(args.refresh_concurrency)
+
+            async def refresh(ingame_id, account_registrations):
+                async with semaphore:
+                    await refresh_player_profile(bot, ingame_id, account_registrations)
+
+            await asyncio.gather(*(refresh(ingame_id, regs) for ingame_id, regs in registrations.items()))
+            await bot.write_buffer.flush()
+            changes = []
+            for guild_config in guild_configs.all():
+                changes.extend(await reconcile_rank_roles(bot, bot.get_guild(guild_config.guild_id), guild_config))
+            return changes
+
+        async def render_leaderboards():
+            for guild_config in guild_configs.all():
+                await update_leaderboards(bot, bot.get_channel(guild_config.leaderboard_channel_id))
+
+        live_channels = [bot.get_channel(config.active_players_channel_id) for config in guild_configs.all()]
+
+        role_changes = await report.run("refresh window (all)", full_refresh)
+        await report.run("leaderboard render", render_leaderboards)
+        await report.run("live tick (cold start)", lambda: update_active_players(bot, live_channels))
+        await report.run("live tick (tiered)", lambda: update_active_players(bot, live_channels))
+
+        report.print()
+        print()
+        role_calls = sum(member.edit_count for guild in bot.guilds for member in guild.members)
+        print(f"Role edits: {len(role_changes)} ({role_calls} member edit calls) • write buffer flushes: {bot.write_buffer.flush_count} "
+              f"({bot.write_buffer.written_count} writes) • scheduler throttled: {scheduler.throttled_count}")
+        stats = bot.profile_cache.stats()
+        print(f"Profile cache: {stats['size']} entries, {stats['hit_rate']:.0%} hit rate")
+
+        await scheduler.close()
+        await http_session.close()
+        await db.close()
+    await server.stop()
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s: %(message)s')
+    if args.trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    asyncio.run(run(args))
+    total = time.perf_counter() - start
+
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+    print(f"Total wall time {total:.2f}s • peak RSS {max_rss_mb:.1f} MB", end="")
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        print(f" • Python heap peak {peak / (1024 * 1024):.1f} MB", end="")
+    print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Local stand-in for the aoe4world API used by the load benchmarks.
+
+Serves /api/v0/players/{id}.json and /api/v0/games with synthetic data that is
+deterministic per profile id, plus configurable latency, errors and 429s.
+"""
+import asyncio
+import random
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+RANK_LEVELS = [
+    "bronze_1", "bronze_2", "bronze_3", "silver_1", "silver_2", "silver_3",
+    "gold_1", "gold_2", "gold_3", "platinum_1", "platinum_2", "platinum_3",
+    "diamond_1", "diamond_2", "diamond_3", "conqueror_1", "conqueror_2", "conqueror_3"
+]
+CIVS = ["english", "french", "mongols", "rus", "chinese", "abbasid_dynasty", "delhi_sultanate", "holy_roman_empire"]
+MAPS = ["Dry Arabia", "Hideout", "Lipany", "Mountain Pass", "Altai"]
+GAME_KINDS = ["rm_1v1", "rm_2v2", "qm_1v1", "qm_3v3"]
+
+def _iso(dt):
+    return dt.isoformat().replace('+00:00', 'Z')
+
+class FakeAoe4World:
+    """aiohttp server emulating the aoe4world endpoints the bot calls.
+
+    latency / jitter: seconds added to every response
+    error_rate: fraction of requests answered with a 503
+    throttle_every: every Nth request gets a 429 with Retry-After (0 disables)
+    ongoing_rate / recent_rate: fraction of players in a game / finished one recently
+    history_games: most older games a pair of players has
+    page_size: games per page of /games, which like the real endpoint only
+    returns the most recent games of all the requested players combined"""
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, throttle_every=0,
+                 retry_after=1, ongoing_rate=0.1, recent_rate=0.2, history_games=5, page_size=50, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.ongoing_rate = ongoing_rate
+        self.recent_rate = recent_rate
+        self.history_games = history_games
+        self.page_size = page_size
+        self.random = random.Random(seed)
+        self.requests = Counter()  # (endpoint, status) -> count
+        self.profile_ids_requested = 0
+        self._request_number = 0
+        self._runner = None
+        self.port = None
+
+    @property
+    def api_root(self):
+        return f"http://127.0.0.1:{self.port}/api/v0"
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get('/api/v0/players/{profile_id}.json', self._handle_player)
+        app.router.add_get('/api/v0/games', self._handle_games)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def snapshot(self):
+        """Copy of the request counters, for per-phase deltas"""
+        return Counter(self.requests)
+
+    async def _gate(self, endpoint):
+        """Apply latency, throttling and errors. Returns an error response or None"""
+        self._request_number += 1
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        if self.throttle_every and self._request_number % self.throttle_every == 0:
+            self.requests[(endpoint, 429)] += 1
+            return web.json_response({'error': 'rate limited'}, status=429,
+                                     headers={'Retry-After': str(self.retry_after)})
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.requests[(endpoint, 503)] += 1
+            return web.json_response({'error': 'unavailable'}, status=503)
+        return None
+
+    def _player_random(self, profile_id):
+        return random.Random(zlib.crc32(str(profile_id).encode()))
+
+    def _mode(self, rng):
+        wins = rng.randint(0, 400)
+        losses = rng.randint(0, 400)
+        return {
+            'rating': rng.randint(400, 2400),
+            'rank': rng.randint(1, 200000),
+            'rank_level': rng.choice(RANK_LEVELS),
+            'win_rate': round(100 * wins / max(1, wins + losses), 1),
+            'streak': rng.randint(-6, 6),
+            'wins_count': wins,
+            'losses_count': losses,
+            'previous_seasons': [{'season': 8, 'rank_level': rng.choice(RANK_LEVELS)}]
+        }
+
+    def player(self, profile_id):
+        rng = self._player_random(profile_id)
+        now = datetime.now(timezone.utc)
+        return {
+            'name': f"Player{profile_id}",
+            'profile_id': int(profile_id),
+            'last_game_at': _iso(now - timedelta(minutes=rng.randint(1, 60 * 24 * 7))),
+            'modes': {'rm_solo': self._mode(rng), 'rm_team': self._mode(rng)}
+        }
+
+    def _game(self, rng, base, game_id, ongoing, started_at, updated_at):
+        winner = rng.randint(0, 1)
+        teams = [
+            [{'player': {
+                'profile_id': base + side,
+                'civilization': rng.choice(CIVS),
+                'result': None if ongoing else ('win' if side == winner else 'loss')
+            }}]
+            for side in (0, 1)
+        ]
+        return {
+            'game_id': game_id,
+            'ongoing': ongoing,
+            'started_at': _iso(started_at),
+            'updated_at': _iso(updated_at),
+            'kind': rng.choice(GAME_KINDS),
+            'map': rng.choice(MAPS),
+            'teams': teams
+        }
+
+    def pair_games(self, profile_id):
+        """Games of a player's pair (ids 2k and 2k+1 play each other), most recent first.
+
+        A pair may be in a game or have finished one recently; either way it has
+        up to history_games older games from the past week."""
+        base = int(profile_id) & ~1
+        rng = self._player_random(f"game-{base}")
+        roll = rng.random()
+        now = datetime.now(timezone.utc)
+        games = []
+        if roll < self.ongoing_rate:
+            started_at = now - timedelta(minutes=rng.randint(1, 40))
+            games.append(self._game(rng, base, 900000000 + base // 2, True, started_at, now))
+        elif roll < self.ongoing_rate + self.recent_rate:
+            started_at = now - timedelta(minutes=rng.randint(20, 60))
+            updated_at = now - timedelta(minutes=rng.randint(1, 14))
+            games.append(self._game(rng, base, 900000000 + base // 2, False, started_at, updated_at))
+
+        started_at = now - timedelta(hours=rng.randint(2, 12))
+        for index in range(rng.randint(0, self.history_games)):
+            game_id = 800000000 + (base // 2) * self.history_games + index
+            games.append(self._game(rng, base, game_id, False, started_at, started_at + timedelta(minutes=30)))
+            started_at -= timedelta(hours=rng.randint(2, 24))
+        return games
+
+    async def _handle_player(self, request):
+        error = await self._gate('players')
+        if error:
+            return error
+        profile_id = request.match_info['profile_id']
+        self.requests[('players', 200)] += 1
+        self.profile_ids_requested += 1
+        return web.json_response(self.player(profile_id))
+
+    async def _handle_games(self, request):
+        error = await self._gate('games')
+        if error:
+            return error
+        profile_ids = [pid for pid in request.query.get('profile_ids', '').split(',') if pid]
+        page = max(1, int(request.query.get('page', 1)))
+        self.requests[('games', 200)] += 1
+        self.profile_ids_requested += len(profile_ids)
+        games = {}
+        for pid in profile_ids:
+            for game in self.pair_games(pid):
+                games.setdefault(game['game_id'], game)
+        ordered = sorted(games.values(), key=lambda game: game['started_at'], reverse=True)
+        offset = (page - 1) * self.page_size
+        page_games = ordered[offset:offset + self.page_size]
+        return web.json_response({
+            'total_count': len(ordered), 'page': page, 'per_page': self.page_size,
+            'count': len(page_games), 'offset': offset, 'games': page_games
+        })
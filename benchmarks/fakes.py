@@ -0,0 +1,101 @@
+"""Minimal stand-ins for the discord.py objects the background tasks touch."""
+import itertools
+
+_message_ids = itertools.count(500000000000000000)
+
+class FakeRole:
+    def __init__(self, role_id, name="role", default=False):
+        self.id = role_id
+        self.name = name
+        self._default = default
+
+    def is_default(self):
+        return self._default
+
+class FakeMember:
+    def __init__(self, member_id, roles=()):
+        self.id = member_id
+        self.mention = f"<@{member_id}>"
+        self.display_name = f"member{member_id}"
+        self.roles = list(roles)
+        self.edit_count = 0
+
+    async def edit(self, roles=None, reason=None):
+        self.edit_count += 1
+        if roles is not None:
+            self.roles = [role for role in self.roles if role.is_default()] + list(roles)
+
+class FakeMessage:
+    def __init__(self, channel, message_id=None, **content):
+        self.channel = channel
+        self.id = message_id or next(_message_ids)
+        self.content = content
+
+    async def edit(self, **content):
+        self.channel.edits += 1
+        self.content = content
+
+class FakeChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = []
+        self.edits = 0
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self, content=content, **kwargs)
+        self.sent.append(message)
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+    async def fetch_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+class FakeGuild:
+    def __init__(self, guild_id, roles):
+        self.id = guild_id
+        self.default_role = FakeRole(guild_id, "@everyone", default=True)
+        self._roles = {role.id: role for role in roles}
+        self._members = {}
+
+    def add_member(self, member_id):
+        member = FakeMember(member_id, [self.default_role])
+        self._members[member_id] = member
+        return member
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+class FakeBot:
+    """Carries the attributes the task functions read from AOE4RankBot"""
+
+    def __init__(self, db, write_buffer, http_session, api_scheduler, profile_cache, game_tracker,
+                 guild_configs, guilds, channels):
+        self.db = db
+        self.write_buffer = write_buffer
+        self.http_session = http_session
+        self.api_scheduler = api_scheduler
+        self.profile_cache = profile_cache
+        self.game_tracker = game_tracker
+        self.guild_configs = guild_configs
+        self._guilds = {guild.id: guild for guild in guilds}
+        self._channels = {channel.id: channel for channel in channels}
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    @property
+    def guilds(self):
+        return list(self._guilds.values())
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
@@ -0,0 +1,185 @@
+"""Legacy selector-chain article extractors, kept as the baseline for bench_extraction.
+
+news.py used to run these one field at a time, each with its own select_one
+chain over the whole page; extraction.extract_article replaces them with a
+single pass.
+"""
+import re
+from datetime import datetime
+
+def extract_article_title(soup):
+    """Extract the actual article title from the HTML"""
+    # Look for the most specific title elements first
+    title_elem = (
+        soup.select_one('article h1') or
+        soup.select_one('main h1') or
+        soup.select_one('.article-title') or
+        soup.select_one('.entry-title') or
+        soup.select_one('h1')
+    )
+    
+    if title_elem:
+        title = title_elem.get_text(strip=True)
+        # Remove any unnecessary prefixes
+        title = re.sub(r'^(Age of Empires IV:?\s*)', '', title)
+        return title
+    
+    # Fallback to page title
+    if soup.title:
+        title = soup.title.get_text(strip=True)
+        # Clean up page title
+        title = re.sub(r'\s*\|\s*Age of Empires.*$', '', title)
+        title = re.sub(r'^(Age of Empires IV:?\s*)', '', title)
+        return title
+        
+    return None
+
+def extract_article_date(soup):
+    """Extract the publication date from the article"""
+    # Try various date elements
+    date_elem = (
+        soup.select_one('meta[property="article:published_time"]') or
+        soup.select_one('.article-date') or
+        soup.select_one('.post-date') or
+        soup.select_one('time')
+    )
+    
+    if date_elem:
+        if date_elem.name == 'meta':
+            date_str = date_elem.get('content')
+            if date_str:
+                try:
+                    date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+                    return date_obj.strftime("%B %d, %Y")
+                except:
+                    pass
+        else:
+            return date_elem.get_text(strip=True)
+    
+    # Try to find date in the text
+    date_patterns = [
+        r'(\w+ \d{1,2}, 20\d{2})',  # March 10, 2025
+        r'(\d{1,2} \w+ 20\d{2})',    # 10 March 2025
+        r'(\d{2}/\d{2}/20\d{2})'     # 03/10/2025
+    ]
+    
+    for pattern in date_patterns:
+        match = re.search(pattern, soup.get_text())
+        if match:
+            return match.group(1)
+    
+    return "Unknown date"
+
+def extract_article_author(soup):
+    """Extract the author from the article"""
+    author_elem = (
+        soup.select_one('.author') or
+        soup.select_one('.byline') or
+        soup.select_one('.post-author') or
+        soup.select_one('meta[name="author"]')
+    )
+    
+    if author_elem:
+        if author_elem.name == 'meta':
+            return author_elem.get('content')
+        else:
+            author_text = author_elem.get_text(strip=True)
+            # Clean up "by Author Name" format
+            author_text = re.sub(r'^by\s+', '', author_text, flags=re.IGNORECASE)
+            return author_text
+    
+    return None
+
+def extract_article_content(soup):
+    """Extract the main content from the article"""
+    # Try to find the main content container
+    content_elem = (
+        soup.select_one('article .content') or
+        soup.select_one('.article-content') or
+        soup.select_one('.entry-content') or
+        soup.select_one('.post-content') or
+        soup.select_one('main')
+    )
+    
+    if not content_elem:
+        content_elem = soup
+    
+    # Extract paragraphs
+    paragraphs = content_elem.select('p')
+    
+    # Filter out navigation, comments, etc.
+    filtered_paragraphs = []
+    for p in paragraphs:
+        # Skip paragraphs in navigation, sidebar, footer, etc.
+        if any(p.parent.name == x or p.parent.get('class') and any(c in ' '.join(p.parent.get('class')) for c in x) 
+               for x in ['nav', 'menu', 'sidebar', 'footer', 'comment']):
+            continue
+        
+        # Skip empty paragraphs
+        if not p.get_text(strip=True):
+            continue
+            
+        # Skip very short paragraphs that might be buttons or navigation
+        if len(p.get_text(strip=True)) < 10 and not any(c.name == 'a' for c in p.children):
+            continue
+            
+        filtered_paragraphs.append(p.get_text(strip=True))
+    
+    # Create full content and preview
+    if filtered_paragraphs:
+        full_content = '\n\n'.join(filtered_paragraphs)
+        
+        # Create preview (first few paragraphs)
+        preview_paragraphs = []
+        preview_length = 0
+        for p in filtered_paragraphs:
+            preview_paragraphs.append(p)
+            preview_length += len(p)
+            if preview_length > 800:
+                break
+                
+        preview = '\n\n'.join(preview_paragraphs)
+        if len(preview) < len(full_content):
+            preview += '\n\n... [Read more on the website]'
+            
+        return full_content, preview
+    
+    return None, None
+
+def extract_article_image(soup):
+    """Extract the main image from the article"""
+    # Try to find header/featured image
+    image_elem = (
+        soup.select_one('.article-image img') or
+        soup.select_one('.featured-image img') or
+        soup.select_one('article img') or
+        soup.select_one('.post-thumbnail img') or
+        soup.select_one('main img')
+    )
+    
+    if image_elem and image_elem.get('src'):
+        src = image_elem['src']
+        if not src.startswith('http'):
+            src = f"https://www.ageofempires.com{src}"
+        return src
+    
+    return None
+
+def extract_article_category(soup):
+    """Extract the article category"""
+    category_elem = (
+        soup.select_one('.category') or
+        soup.select_one('.article-category') or
+        soup.select_one('.post-category')
+    )
+    
+    if category_elem:
+        return category_elem.get_text(strip=True)
+    
+    # Look for category in breadcrumbs
+    breadcrumbs = soup.select('.breadcrumbs a, .breadcrumb a')
+    for crumb in breadcrumbs:
+        if 'category' in crumb.get('href', ''):
+            return crumb.get_text(strip=True)
+    
+    return "Uncategorized"
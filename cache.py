@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import *
+
+logger = logging.getLogger('AOE4RankBot')
+
+class ProfileCache:
+    """In-process LRU cache of aoe4world profiles keyed by ingame_id.
+
+    Entries younger than ttl are served directly. Entries older than ttl but
+    younger than stale_ttl can be served immediately while a background
+    refresh fetches a new copy (stale-while-revalidate)."""
+
+    def __init__(self, ttl: float = PROFILE_CACHE_TTL, stale_ttl: float = PROFILE_CACHE_STALE_TTL,
+                 max_size: int = PROFILE_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, ingame_id, loader: Callable[[str], Awaitable[Optional[Any]]],
+                  allow_stale: bool = True) -> Optional[Any]:
+        """Return the cached profile, calling loader(ingame_id) when it is missing or expired"""
+        key = str(ingame_id)
+        entry = self._entries.get(key)
+        if entry:
+            fetched_at, data = entry
+            age = time.monotonic() - fetched_at
+            if age <= self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return data
+            if allow_stale and age <= self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._start_load(key, loader)
+                return data
+
+        self.misses += 1
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def put(self, ingame_id, data: Any):
+        """Store a freshly fetched profile"""
+        key = str(ingame_id)
+        self._entries[key] = (time.monotonic(), data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def export(self) -> List[Tuple[str, float, Any]]:
+        """(ingame_id, age in seconds, profile) for every entry, oldest first"""
+        now = time.monotonic()
+        return [(key, now - fetched_at, data) for key, (fetched_at, data) in self._entries.items()]
+
+    def restore(self, entries) -> int:
+        """Add exported entries that are still within stale_ttl. Returns how many were added"""
+        now = time.monotonic()
+        restored = 0
+        for key, age, data in entries:
+            if age <= self.stale_ttl and key not in self._entries:
+                self._entries[key] = (now - age, data)
+                restored += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return restored
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for tuning the TTL"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+    def _start_load(self, key: str, loader) -> asyncio.Task:
+        # Collapse concurrent loads of the same profile into one request
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            self._inflight[key] = task
+        return task
+
+    async def _load(self, key: str, loader) -> Optional[Any]:
+        try:
+            data = await loader(key)
+            if data:
+                self.put(key, data)
+            return data
+        except Exception as e:
+            logger.error(f"Error refreshing cached profile {key}: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
@@ -2,16 +2,33 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from typing import Optional, Literal
+import asyncio
 import logging
 
 from config import *
-from database import fetch_player_data
-from utils import format_rank_display, update_player_role
+from utils import format_rank_display, update_player_role, get_player_data
+from scheduler import PRIORITY_INTERACTIVE
+from history import record_snapshots, get_rating_summary
 from news import fetch_aoe4_news, post_aoe4_news
-from tasks import update_leaderboards, update_active_players
+from tasks import publish_leaderboard
+from metrics import (
+    LOOP_DURATION, LOOP_LAST_DURATION, LOOP_OVERRUNS, LOOP_ERRORS, HTTP_REQUEST_DURATION,
+    DB_OPERATION_DURATION, DISCORD_REQUESTS, EVENT_LOOP_LAG, EVENT_LOOP_LAG_HISTOGRAM, REGISTERED_PLAYERS
+)
 
 logger = logging.getLogger('AOE4RankBot')
 
+async def format_rating_trend(bot, ingame_id, mode):
+    """Format 7d/30d rating changes from stored history, or an empty string if there is none"""
+    week = await get_rating_summary(bot.db, ingame_id, mode, 7)
+    month = await get_rating_summary(bot.db, ingame_id, mode, 30)
+    if not week or not month:
+        return ""
+    return (
+        f"\nTrend: 7d `{week['delta']:+d}` • 30d `{month['delta']:+d}` "
+        f"(30d Peak: `{month['peak']}`)"
+    )
+
 def register_commands(bot):
     @bot.tree.command(name="register", description="Register a main or smurf account")
     async def register(interaction: discord.Interaction, user: discord.Member, ingame_id: str, account_type: Literal["main", "smurf"]):
@@ -19,16 +36,17 @@ def register_commands(bot):
         
         try:
             if account_type == "smurf":
-                has_main = bot.db.query_one(
-                    "SELECT COUNT(*) FROM players WHERE discord_id = ? AND is_main = 1", 
-                    (user.id,)
+                has_main = await bot.db.query_one(
+                    "SELECT COUNT(*) FROM players WHERE guild_id = ? AND discord_id = ? AND is_main = 1", 
+                    (interaction.guild.id, user.id)
                 )
                 
                 if has_main and has_main[0] <= 0:
                     await interaction.followup.send("User must have a main account before registering smurfs. Register a main account first.", ephemeral=True)
                     return
 
-            data = await fetch_player_data(ingame_id)
+            # Registration stores the rank, so it must not come from a stale cache entry
+            data = await get_player_data(bot, ingame_id, allow_stale=False, priority=PRIORITY_INTERACTIVE)
             if not data:
                 await interaction.followup.send("Invalid in-game ID or data could not be fetched.", ephemeral=True)
                 return
@@ -44,18 +62,17 @@ def register_commands(bot):
 
             is_main = account_type == "main"
             
-            bot.db.execute("""
+            await bot.db.execute("""
                 INSERT OR REPLACE INTO players 
-                (discord_id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user.id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main))
-            bot.db.commit()
+                (guild_id, discord_id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (interaction.guild.id, user.id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main))
+            await record_snapshots(bot.db, ingame_id, data)
 
             if is_main:
                 try:
-                    await update_player_role(interaction.guild, user.id, rank_level)
-                except discord.Forbidden:
-                    logger.warning(f"Bot lacks permission to update roles for user {user.id}")
+                    guild_config = bot.guild_configs.get_or_create(interaction.guild.id)
+                    await update_player_role(interaction.guild, user.id, rank_level, guild_config.rank_roles)
                 except Exception as e:
                     logger.error(f"Error updating role: {e}")
 
@@ -72,34 +89,24 @@ def register_commands(bot):
     async def leaderboard(interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
-        leaderboard_channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
+        guild_config = bot.guild_configs.get(interaction.guild.id)
+        leaderboard_channel = bot.get_channel(guild_config.leaderboard_channel_id) if guild_config and guild_config.leaderboard_channel_id else None
         if not leaderboard_channel:
-            await interaction.followup.send("Leaderboard channel not found!", ephemeral=True)
+            await interaction.followup.send("Leaderboard channel not found! An admin can set one with /setup.", ephemeral=True)
             return
 
         try:
-            solo_embed, team_embed = await update_leaderboards(
+            created = await publish_leaderboard(
                 bot,
-                interaction.channel, 
+                guild_config,
+                leaderboard_channel,
                 forced_update=True,
                 trigger_user=interaction.user
             )
-            
-            if bot.leaderboard_message_id:
-                try:
-                    message = await leaderboard_channel.fetch_message(bot.leaderboard_message_id)
-                    await message.edit(embeds=[solo_embed, team_embed])
-                    await interaction.followup.send("Leaderboard updated successfully!", ephemeral=True)
-                except discord.NotFound:
-                    message = await leaderboard_channel.send(embeds=[solo_embed, team_embed])
-                    bot.leaderboard_message_id = message.id
-                    bot.save_state()
-                    await interaction.followup.send("Created new leaderboard message!", ephemeral=True)
-            else:
-                message = await leaderboard_channel.send(embeds=[solo_embed, team_embed])
-                bot.leaderboard_message_id = message.id
-                bot.save_state()
+            if created:
                 await interaction.followup.send("Created new leaderboard message!", ephemeral=True)
+            else:
+                await interaction.followup.send("Leaderboard updated successfully!", ephemeral=True)
         except Exception as e:
             logger.error(f"Error updating leaderboard: {e}")
             await interaction.followup.send("An error occurred while updating the leaderboard.", ephemeral=True)
@@ -110,9 +117,9 @@ def register_commands(bot):
 
         target_user = user or interaction.user
         
-        accounts = bot.db.query(
-            "SELECT ingame_id, is_main FROM players WHERE discord_id = ? ORDER BY is_main DESC", 
-            (target_user.id,)
+        accounts = await bot.db.query(
+            "SELECT ingame_id, is_main FROM players WHERE guild_id = ? AND discord_id = ? ORDER BY is_main DESC", 
+            (interaction.guild.id, target_user.id)
         )
         
         if not accounts:
@@ -124,7 +131,7 @@ def register_commands(bot):
         total_wins = {'solo': 0, 'team': 0}
 
         for ingame_id, is_main in accounts:
-            data = await fetch_player_data(ingame_id)
+            data = await get_player_data(bot, ingame_id, priority=PRIORITY_INTERACTIVE)
             if not data:
                 continue
 
@@ -146,6 +153,7 @@ def register_commands(bot):
                 streak_emoji = "🔥" if solo_data.get('streak', 0) > 2 else "❄️" if solo_data.get('streak', 0) < -2 else "➖"
                 total_games['solo'] += solo_data.get('games_count', 0)
                 total_wins['solo'] += solo_data.get('wins_count', 0)
+                trend = await format_rating_trend(bot, ingame_id, 'rm_solo')
                 
                 profile_embed.add_field(
                     name="🎮 Ranked Solo",
@@ -154,6 +162,7 @@ def register_commands(bot):
                         f"Rating: `{solo_data.get('rating', 0)}` (Peak: `{solo_data.get('max_rating', 0)}`)\n"
                         f"W/L: `{solo_data.get('wins_count', 0)}/{solo_data.get('losses_count', 0)}` ({solo_data.get('win_rate', 0):.1f}%)\n"
                         f"Streak: `{solo_data.get('streak', 0):+d}` {streak_emoji}"
+                        f"{trend}"
                     ),
                     inline=False
                 )
@@ -172,6 +181,7 @@ def register_commands(bot):
                 streak_emoji = "🔥" if team_data.get('streak', 0) > 2 else "❄️" if team_data.get('streak', 0) < -2 else "➖"
                 total_games['team'] += team_data.get('games_count', 0)
                 total_wins['team'] += team_data.get('wins_count', 0)
+                trend = await format_rating_trend(bot, ingame_id, 'rm_team')
                 
                 profile_embed.add_field(
                     name="👥 Ranked Team",
@@ -180,6 +190,7 @@ def register_commands(bot):
                         f"Rating: `{team_data.get('rating', 0)}` (Peak: `{team_data.get('max_rating', 0)}`)\n"
                         f"W/L: `{team_data.get('wins_count', 0)}/{team_data.get('losses_count', 0)}` ({team_data.get('win_rate', 0):.1f}%)\n"
                         f"Streak: `{team_data.get('streak', 0):+d}` {streak_emoji}"
+                        f"{trend}"
                     ),
                     inline=False
                 )
@@ -237,7 +248,10 @@ def register_commands(bot):
                 return
 
             # Fetch all registered players
-            players = bot.db.query("SELECT DISTINCT discord_id, ingame_name FROM players")
+            players = await bot.db.query(
+                "SELECT DISTINCT discord_id, ingame_name FROM players WHERE guild_id = ?",
+                (interaction.guild.id,)
+            )
             
             if not players:
                 await interaction.followup.send("No registered players found.", ephemeral=True)
@@ -269,8 +283,10 @@ def register_commands(bot):
             return
 
         # Delete the user's data
-        bot.db.execute("DELETE FROM players WHERE discord_id = ?", (target_id,))
-        bot.db.commit()
+        await bot.db.execute(
+            "DELETE FROM players WHERE guild_id = ? AND discord_id = ?",
+            (interaction.guild.id, target_id)
+        )
         
         await interaction.followup.send(f"Successfully deleted data for {user.mention}.", ephemeral=True)
 
@@ -278,7 +294,10 @@ def register_commands(bot):
     async def showall(interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=False)
             
-        players = bot.db.query("SELECT discord_id, ingame_id, ingame_name, is_main FROM players")
+        players = await bot.db.query(
+            "SELECT discord_id, ingame_id, ingame_name, is_main FROM players WHERE guild_id = ?",
+            (interaction.guild.id,)
+        )
         
         # Create a list to hold all embeds
         embeds = []
@@ -365,19 +384,12 @@ def register_commands(bot):
         try:
             await interaction.followup.send(f"Checking for Age of Empires IV {news_type} news... This may take a moment.", ephemeral=True)
             
-            articles = []
-            if news_type == "both" or news_type == "patch":
-                patch_articles = await fetch_aoe4_news(news_type="patch")
-                if patch_articles:
-                    articles.extend(patch_articles)
-                    
-            if news_type == "both" or news_type == "announcement":
-                announcement_articles = await fetch_aoe4_news(news_type="announcement")
-                if announcement_articles:
-                    articles.extend(announcement_articles)
+            news_types = ["patch", "announcement"] if news_type == "both" else [news_type]
+            results = await asyncio.gather(*(fetch_aoe4_news(bot, news_type=t) for t in news_types))
+            articles = [article for result in results for article in result]
             
             if not articles:
-                await interaction.followup.send(f"No AOE4 {news_type} news found. The website may have changed structure or there might be connectivity issues.", ephemeral=True)
+                await interaction.followup.send(f"No new AOE4 {news_type} news found. Recent articles have already been posted, or the website may have changed structure.", ephemeral=True)
                 return
             
             # Deduplicate by URL to avoid posting the same article twice
@@ -391,7 +403,7 @@ def register_commands(bot):
                     
             articles = unique_articles
             
-            await interaction.followup.send(f"Found {len(articles)} AOE4 news articles. Posting up to 3 most recent ones if they haven't been posted already.", ephemeral=True)
+            await interaction.followup.send(f"Found {len(articles)} unposted AOE4 news articles. Posting up to 3 most recent ones.", ephemeral=True)
             
             posted_count = 0
             max_to_post = 3  # Limit to avoid spam
@@ -408,4 +420,123 @@ def register_commands(bot):
                 await interaction.followup.send("No new AOE4 news to post. All recent articles have already been posted.", ephemeral=True)
         except Exception as e:
             logger.error(f"Error in force news check: {e}", exc_info=True)
-            await interaction.followup.send(f"Error checking for AOE4 news: {str(e)}\nCheck server logs for more details.", ephemeral=True)
\ No newline at end of file
+            await interaction.followup.send(f"Error checking for AOE4 news: {str(e)}\nCheck server logs for more details.", ephemeral=True)
+
+    @bot.tree.command(name="setup", description="Choose the channels the bot posts to in this server")
+    @app_commands.default_permissions(administrator=True)
+    async def setup(
+        interaction: discord.Interaction,
+        rank_channel: Optional[discord.TextChannel] = None,
+        log_channel: Optional[discord.TextChannel] = None,
+        leaderboard_channel: Optional[discord.TextChannel] = None,
+        active_players_channel: Optional[discord.TextChannel] = None
+    ):
+        """Admin command storing this guild's channels"""
+        await interaction.response.defer(ephemeral=True)
+
+        guild_config = bot.guild_configs.get_or_create(interaction.guild.id)
+        if rank_channel:
+            guild_config.rank_channel_id = rank_channel.id
+        if log_channel:
+            guild_config.log_channel_id = log_channel.id
+        if leaderboard_channel and leaderboard_channel.id != guild_config.leaderboard_channel_id:
+            guild_config.leaderboard_channel_id = leaderboard_channel.id
+            guild_config.leaderboard_message_id = None
+        if active_players_channel and active_players_channel.id != guild_config.active_players_channel_id:
+            guild_config.active_players_channel_id = active_players_channel.id
+            guild_config.active_players_message_id = None
+            guild_config.active_players_message = None
+        await bot.guild_configs.save(guild_config)
+
+        def mention(channel_id):
+            return f"<#{channel_id}>" if channel_id else "not set"
+
+        await interaction.followup.send(
+            f"Rank: {mention(guild_config.rank_channel_id)} • Log: {mention(guild_config.log_channel_id)} • "
+            f"Leaderboard: {mention(guild_config.leaderboard_channel_id)} • "
+            f"Active players: {mention(guild_config.active_players_channel_id)}",
+            ephemeral=True
+        )
+
+    @bot.tree.command(name="setrankrole", description="Choose the role given to players of a rank in this server")
+    @app_commands.default_permissions(administrator=True)
+    async def setrankrole(
+        interaction: discord.Interaction,
+        rank: Literal["unranked", "bronze", "silver", "gold", "platinum", "diamond", "conqueror"],
+        role: discord.Role
+    ):
+        """Admin command mapping a base rank to one of this guild's roles"""
+        await interaction.response.defer(ephemeral=True)
+
+        guild_config = bot.guild_configs.get_or_create(interaction.guild.id)
+        guild_config.rank_roles[rank] = role.id
+        await bot.guild_configs.save(guild_config)
+
+        # Roles are applied by the next reconcile pass of the rolling refresh
+        await interaction.followup.send(
+            f"Players ranked `{format_rank_display(rank)}` will get {role.mention}.",
+            ephemeral=True
+        )
+
+    @bot.tree.command(name="botstats", description="Show bot performance statistics")
+    @app_commands.default_permissions(administrator=True)
+    async def botstats(interaction: discord.Interaction):
+        """Admin command summarizing the metrics the bot collects"""
+        await interaction.response.defer(ephemeral=True)
+
+        total = await bot.db.query_one("SELECT COUNT(*) FROM players")
+        REGISTERED_PLAYERS.set(total[0] if total else 0)
+
+        embed = discord.Embed(title="📈 Bot Statistics", color=discord.Color.dark_teal())
+
+        loop_lines = []
+        for name in LOOP_DURATION.label_values('loop'):
+            summary = LOOP_DURATION.summary(loop=name)
+            loop_lines.append(
+                f"`{name}`: last `{LOOP_LAST_DURATION.get(loop=name):.2f}s` • "
+                f"avg `{summary['mean']:.2f}s` • runs `{summary['count']}` • "
+                f"overruns `{int(LOOP_OVERRUNS.get(loop=name))}` • "
+                f"errors `{int(LOOP_ERRORS.get(loop=name))}`"
+            )
+        embed.add_field(name="Loops", value="\n".join(loop_lines) or "No iterations yet", inline=False)
+
+        http_lines = []
+        for host in HTTP_REQUEST_DURATION.label_values('host'):
+            summary = HTTP_REQUEST_DURATION.summary(host=host)
+            statuses = ", ".join(
+                f"{status}: {count}"
+                for status, count in sorted(HTTP_REQUEST_DURATION.counts_by('status', host=host).items())
+            )
+            http_lines.append(
+                f"`{host}`: `{summary['count']}` requests • avg `{summary['mean'] * 1000:.0f}ms` • "
+                f"p95 ≤ `{summary['p95'] * 1000:.0f}ms`\n└ {statuses}"
+            )
+        embed.add_field(name="HTTP", value="\n".join(http_lines) or "No requests yet", inline=False)
+
+        db_lines = []
+        for operation in ("read", "write"):
+            summary = DB_OPERATION_DURATION.summary(operation=operation)
+            db_lines.append(
+                f"{operation}: `{summary['count']}` ops • avg `{summary['mean'] * 1000:.1f}ms` • "
+                f"p95 ≤ `{summary['p95'] * 1000:.0f}ms`"
+            )
+        embed.add_field(name="Database", value="\n".join(db_lines), inline=False)
+
+        failed_calls = sum(value for key, value in DISCORD_REQUESTS.values.items() if dict(key).get('outcome') != 'ok')
+        lag = EVENT_LOOP_LAG.get() or 0.0
+        lag_summary = EVENT_LOOP_LAG_HISTOGRAM.summary()
+        cache_stats = bot.profile_cache.stats()
+        embed.add_field(
+            name="Runtime",
+            value=(
+                f"Discord REST calls: `{int(DISCORD_REQUESTS.total())}` (`{int(failed_calls)}` failed)\n"
+                f"Event loop lag: `{lag * 1000:.0f}ms` now • p95 ≤ `{lag_summary['p95'] * 1000:.0f}ms`\n"
+                f"Registered accounts: `{int(REGISTERED_PLAYERS.get() or 0)}`\n"
+                f"Profile cache: `{cache_stats['size']}` entries • `{cache_stats['hit_rate']:.0%}` hit rate\n"
+                f"API queue: `{sum(bot.api_scheduler.pending().values())}` waiting • "
+                f"write buffer: `{len(bot.write_buffer)}` pending"
+            ),
+            inline=False
+        )
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
\ No newline at end of file
@@ -1,4 +1,10 @@
 # Configuration Constants
+import os
+
+from dotenv import load_dotenv
+
+# Load .env before any setting below reads the environment
+load_dotenv()
 
 # Discord Channel IDs - REPLACE WITH YOUR OWN
 RANK_CHANNEL_ID = 123456789012345678
@@ -19,11 +25,33 @@ RANK_ROLES = {
 }
 
 # API URLs
-API_BASE_URL = "https://aoe4world.com/api/v0/players/"
+# Point AOE4WORLD_API_ROOT at a local stand-in server for testing
+AOE4WORLD_API_ROOT = os.getenv("AOE4WORLD_API_ROOT", "https://aoe4world.com/api/v0").rstrip("/")
+API_BASE_URL = f"{AOE4WORLD_API_ROOT}/players/"
+GAMES_API_URL = f"{AOE4WORLD_API_ROOT}/games"
 ANNOUNCEMENT_NEWS_URL = "https://www.ageofempires.com/news?game=aoeiv"
 PATCH_NOTES_URL = "https://www.ageofempires.com/news/category/releases?game=aoeiv"
 AOE4_ICON_URL = "https://static.wikia.nocookie.net/logopedia/images/b/b3/AoE4Logo.png"
 
+# HTTP Client Settings
+HTTP_CONNECTION_LIMIT = 100   # Total pooled connections
+HTTP_LIMIT_PER_HOST = 10      # Concurrent connections per host
+HTTP_DNS_CACHE_TTL = 300      # Seconds to cache DNS lookups
+HTTP_KEEPALIVE_TIMEOUT = 30   # Seconds to keep idle connections open
+HTTP_TIMEOUT = 20             # Total timeout per request in seconds
+
+# aoe4world Request Scheduler Settings
+AOE4WORLD_RATE_LIMIT = 5      # Sustained requests per second
+AOE4WORLD_RATE_BURST = 10     # Requests allowed in a burst
+AOE4WORLD_MAX_RETRIES = 3     # Retries after throttling or transient errors
+AOE4WORLD_BACKOFF_BASE = 1.0  # Seconds before the first retry (doubles each attempt)
+AOE4WORLD_BACKOFF_MAX = 60.0  # Upper bound on a single backoff delay
+
+# Profile Cache Settings
+PROFILE_CACHE_TTL = 300         # Seconds a cached profile counts as fresh
+PROFILE_CACHE_STALE_TTL = 3600  # Seconds a stale profile may be served while refreshing
+PROFILE_CACHE_MAX_SIZE = 2000   # Maximum cached profiles before LRU eviction
+
 # Rank Display Names
 RANK_DISPLAY = {
     "bronze_3": "Bronze III", "bronze_2": "Bronze II", "bronze_1": "Bronze I",
@@ -65,4 +93,65 @@ GAME_MODES = {
     "rm_2v2": "Ranked Match 2v2",
     "rm_3v3": "Ranked Match 3v3",
     "rm_4v4": "Ranked Match 4v4",
-}
\ No newline at end of file
+}
+
+# Live Game Tracker Settings
+LIVE_TRACKER_CONCURRENCY = 10  # Maximum concurrent games requests per tick
+LIVE_TRACKER_BATCH_SIZE = 50   # Profile IDs packed into one games query
+LIVE_TRACKER_BATCH_ROUNDS = 3  # Re-queries for players a full page left out, before querying them singly
+GAMES_PAGE_SIZE = 50           # Games per page returned by the games endpoint
+GAME_RECENT_MINUTES = 15           # Finished games shown under "Recently Finished"
+GAME_ONGOING_EXPIRY_MINUTES = 180  # Unfinished games no poll has seen for this long are dropped
+GAME_FINISHED_IDS_MAX = 20000      # Finished game ids remembered so polls never parse them again
+
+# Activity Polling Tiers
+# Hot players (in a game or played recently) are polled every tick
+ACTIVITY_HOT_WINDOW_MINUTES = 60   # Last game within this window counts as hot
+ACTIVITY_COLD_AFTER_HOURS = 48     # Idle longer than this counts as cold
+ACTIVITY_WARM_POLL_SECONDS = 300   # Poll interval for warm players
+ACTIVITY_COLD_POLL_SECONDS = 1800  # Poll interval for cold players
+
+# Database Settings
+DB_READ_POOL_SIZE = 3  # Reader threads (each with its own connection)
+DB_BUSY_TIMEOUT = 10   # Seconds to wait on a locked database
+WRITE_BUFFER_MAX_SIZE = 500   # Buffered writes that trigger a flush
+WRITE_BUFFER_MAX_DELAY = 5.0  # Seconds a buffered write may wait before it is flushed
+
+# Leaderboard Settings
+LEADERBOARD_MODES = ("rm_solo", "rm_team")  # Ranked modes stored in the leaderboard table
+LEADERBOARD_REFRESH_WINDOW_HOURS = 24       # Every profile is refreshed once per window
+LEADERBOARD_REFRESH_TICK_SECONDS = 60       # How often the rolling refresher runs
+LEADERBOARD_RENDER_MINUTES = 15             # How often the leaderboard message is re-rendered
+ROLE_EDIT_CONCURRENCY = 5                   # Member role edits in flight during reconciliation
+ROLE_FAILURE_BACKOFF_MINUTES = 30           # Wait before retrying a role Discord refused for a member, doubled per failure
+ROLE_FAILURE_BACKOFF_MAX_MINUTES = 1440     # Longest wait between those retries
+
+# Deployment Settings
+# "all" runs everything in one process. For a split deployment run main.py with
+# BOT_MODE=bot and poller.py next to it; they exchange data through players.db
+BOT_MODE = os.getenv("BOT_MODE", "all")
+POLLER_METRICS_PORT = 9109        # Metrics port of the poller process
+LIVE_GAMES_MAX_AGE_SECONDS = 120  # Ongoing games no poll confirmed for this long are not shown as live
+NEWS_QUEUE_POLL_SECONDS = 60      # How often the bot process posts news queued by the poller
+LOOP_START_STAGGER_SECONDS = 5    # Delay between starting background loops at startup
+
+# Warm-Restart Snapshot Settings
+# Profile cache, activity poll times and news validators are written to a gzipped
+# JSON file so a restart does not refetch everything at once
+SNAPSHOT_ENABLED = True
+SNAPSHOT_PATH = "state_snapshot.json.gz"          # Snapshot of the bot process
+POLLER_SNAPSHOT_PATH = "poller_snapshot.json.gz"  # Snapshot of poller.py
+SNAPSHOT_INTERVAL_MINUTES = 5                     # How often the snapshot is rewritten
+SNAPSHOT_MAX_AGE_MINUTES = 120                    # Older snapshots are ignored at startup
+
+# Metrics Settings
+METRICS_ENABLED = True      # Serve Prometheus metrics over HTTP
+METRICS_HOST = "127.0.0.1"  # Bind address for the metrics endpoint (keep it local)
+METRICS_PORT = 9108         # Port for the metrics endpoint
+METRICS_LAG_INTERVAL = 1.0  # Seconds between event loop lag probes
+
+# News Settings
+NEWS_ARTICLE_CACHE_SIZE = 50  # Parsed articles kept for answering 304 responses
+NEWS_FETCH_CONCURRENCY = 3    # Article pages fetched at the same time
+NEWS_PARSER_MODE = "thread"   # "thread" or "process" worker pool for HTML parsing
+NEWS_PARSER_WORKERS = 2       # Parser pool size
\ No newline at end of file
@@ -1,45 +1,159 @@
 import sqlite3
+import asyncio
+import functools
 import logging
-from typing import Dict, Any, Optional, List, Tuple
+import threading
+import itertools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+
+from config import *
+from metrics import DB_OPERATION_DURATION
 
 logger = logging.getLogger('AOE4RankBot')
 
+# guild_id 0 marks registrations from before multi-guild support; they are
+# assigned to the legacy guild at startup (see GuildConfigStore.adopt_legacy_guild)
+PLAYERS_TABLE = """
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER NOT NULL DEFAULT 0,
+    discord_id INTEGER,
+    ingame_id TEXT,
+    ingame_name TEXT,
+    rank_level TEXT,
+    solo_rank INTEGER,
+    team_rank INTEGER,
+    is_main BOOLEAN DEFAULT 1,
+    PRIMARY KEY (guild_id, discord_id, ingame_id),
+    UNIQUE (guild_id, ingame_id)
+)
+"""
+
+def _add_guild_to_players(cursor):
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(players)")}
+    if 'guild_id' not in columns:
+        # SQLite cannot change a primary key in place, so rebuild the table
+        cursor.execute("ALTER TABLE players RENAME TO players_single_guild")
+        cursor.execute(PLAYERS_TABLE)
+        cursor.execute("""
+            INSERT INTO players (guild_id, discord_id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main)
+            SELECT 0, discord_id, ingame_id, ingame_name, rank_level, solo_rank, team_rank, is_main
+            FROM players_single_guild
+        """)
+        cursor.execute("DROP TABLE players_single_guild")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_players_ingame_id ON players (ingame_id)")
+
+def _add_missing_columns(cursor, table, columns):
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+# Schema migrations as (version, description, apply(cursor)), in order.
+# init_db applies every version newer than the one recorded in schema_version,
+# each in its own transaction. Append new entries; never edit applied ones.
+MIGRATIONS = [
+    (1, "news message_id and url_hash columns",
+     lambda cursor: _add_missing_columns(cursor, 'aoe4_news', {'url_hash': 'TEXT', 'message_id': 'TEXT'})),
+    (2, "news lookup indexes",
+     lambda cursor: [
+         cursor.execute("CREATE INDEX IF NOT EXISTS idx_aoe4_news_url_hash ON aoe4_news (url_hash)"),
+         cursor.execute("CREATE INDEX IF NOT EXISTS idx_aoe4_news_message_id ON aoe4_news (message_id)")
+     ]),
+    (3, "players guild_id for multi-guild mode", _add_guild_to_players),
+    (4, "drop live_games, replaced by games",
+     lambda cursor: cursor.execute("DROP TABLE IF EXISTS live_games"))
+]
+
+def _is_lock_error(error: Exception) -> bool:
+    """Whether an error is a locked/busy database, which a fresh connection may get past"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
 class AOE4Database:
-    def __init__(self, db_path='players.db'):
+    """Async SQLite access kept off the event loop.
+
+    Writes are serialized on a dedicated writer thread; reads run on a small
+    pool of reader threads. The database is in WAL mode, so readers never
+    block the writer. Each thread owns its own connection."""
+
+    def __init__(self, db_path='players.db', read_pool_size=DB_READ_POOL_SIZE):
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aoe4db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix='aoe4db-reader')
         self.init_db()
-    
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        """Drop the calling thread's connection so the next call reconnects"""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is None:
+            return
+        with self._connections_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error closing database connection: {e}")
+
     def init_db(self):
+        """Create the schema. Runs synchronously before the event loop starts"""
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.cursor = self.conn.cursor()
-            
-            # Player table
-            self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS players (
-                discord_id INTEGER,
-                ingame_id TEXT UNIQUE,
-                ingame_name TEXT,
-                rank_level TEXT,
-                solo_rank INTEGER,
-                team_rank INTEGER,
-                is_main BOOLEAN DEFAULT 1,
-                PRIMARY KEY (discord_id, ingame_id)
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            cursor = conn.cursor()
+
+            # Player table, one row per registration in a guild
+            cursor.execute(PLAYERS_TABLE)
+
+            # Per-guild channels, rank roles and bot message ids
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS guild_config (
+                guild_id INTEGER PRIMARY KEY,
+                rank_channel_id INTEGER,
+                log_channel_id INTEGER,
+                leaderboard_channel_id INTEGER,
+                active_players_channel_id INTEGER,
+                rank_roles TEXT,
+                leaderboard_message_id INTEGER,
+                active_players_message_id INTEGER
             )
             """)
-            
+
             # Bot state table
-            self.cursor.execute("""
+            cursor.execute("""
             CREATE TABLE IF NOT EXISTS bot_state (
                 key TEXT PRIMARY KEY,
                 value TEXT
             )
             """)
-            
+
             # News table
-            self.cursor.execute("""
+            cursor.execute("""
             CREATE TABLE IF NOT EXISTS aoe4_news (
                 post_id TEXT PRIMARY KEY,
                 title TEXT,
@@ -53,39 +167,208 @@ class AOE4Database:
                 posted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
             """)
-            
-            self.conn.commit()
+
+            # Materialized leaderboard, one row per player and ranked mode
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboard (
+                ingame_id TEXT,
+                mode TEXT,
+                name TEXT,
+                rating INTEGER,
+                rank INTEGER,
+                rank_level TEXT,
+                win_rate REAL,
+                streak INTEGER,
+                season_info TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (ingame_id, mode)
+            )
+            """)
+
+            # When each profile was last refreshed by the rolling refresher
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS profile_refresh (
+                ingame_id TEXT PRIMARY KEY,
+                refreshed_at TIMESTAMP
+            )
+            """)
+
+            # Rating snapshots taken whenever a profile is refreshed (ts is unix seconds)
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rating_history (
+                ingame_id TEXT,
+                mode TEXT,
+                rating INTEGER,
+                rank INTEGER,
+                rank_level TEXT,
+                wins INTEGER,
+                losses INTEGER,
+                ts INTEGER
+            )
+            """)
+            cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_rating_history_player
+            ON rating_history (ingame_id, mode, ts)
+            """)
+
+            # Observed player activity, used to pick each player's polling tier
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_activity (
+                ingame_id TEXT PRIMARY KEY,
+                last_game_at INTEGER,
+                last_polled_at INTEGER,
+                ongoing BOOLEAN DEFAULT 0
+            )
+            """)
+
+            # Games of registered players, written as they move from ongoing to finished
+            # (times are unix seconds; players is JSON profile_id -> [team, civ, result])
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS games (
+                game_id INTEGER PRIMARY KEY,
+                kind TEXT,
+                map TEXT,
+                state TEXT,
+                started_at INTEGER,
+                finished_at INTEGER,
+                last_seen_at INTEGER,
+                players TEXT
+            )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_games_finished_at ON games (finished_at)")
+
+            # Articles fetched by the poller process, waiting for the bot process to post them
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS news_queue (
+                url_hash TEXT PRIMARY KEY,
+                article TEXT,
+                queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+
+            # Applied schema migrations
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+
+            conn.commit()
+            self._migrate(conn)
+            conn.close()
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
-    
-    def update_news_table_schema(self):
-        """Add columns to news table if they don't exist"""
-        try:
-            # Check if url_hash column exists
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Apply pending MIGRATIONS in order, recording each in schema_version"""
+        current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
             try:
-                self.cursor.execute("SELECT url_hash FROM aoe4_news LIMIT 1")
-            except sqlite3.OperationalError:
-                self.cursor.execute("ALTER TABLE aoe4_news ADD COLUMN url_hash TEXT")
-                
-            # Check if message_id column exists
+                conn.execute("BEGIN")
+                apply(conn.cursor())
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Schema migration {version} ({description}) failed")
+                raise
+            logger.info(f"Applied schema migration {version}: {description}")
+
+    # Worker-thread operations
+
+    def _query_sync(self, query: str, params: tuple, fetch_one: bool):
+        try:
+            cursor = self._get_connection().execute(query, params)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Database error querying: {e}")
+            logger.error(f"Query: {query}, Params: {params}")
+            if not _is_lock_error(e):
+                raise
+            # Reconnect and retry
+            self._reset_connection()
+            cursor = self._get_connection().execute(query, params)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+
+    def _write_sync(self, statements: List[Tuple[str, Any, bool]]) -> int:
+        """Run (query, params, many) statements in one transaction and return the total rowcount"""
+        def run(conn):
+            rowcount = 0
             try:
-                self.cursor.execute("SELECT message_id FROM aoe4_news LIMIT 1")
-            except sqlite3.OperationalError:
-                self.cursor.execute("ALTER TABLE aoe4_news ADD COLUMN message_id TEXT")
-                
-            self.conn.commit()
-            logger.info("News table schema updated to include message_id and url_hash")
+                for query, params, many in statements:
+                    cursor = conn.executemany(query, params) if many else conn.execute(query, params)
+                    rowcount += max(cursor.rowcount, 0)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return rowcount
+
+        try:
+            return run(self._get_connection())
         except Exception as e:
-            logger.error(f"Error updating news table schema: {e}")
-    
-    def get_bot_state(self) -> Dict[str, Any]:
+            logger.error(f"Database error executing query: {e}")
+            logger.error(f"Statements: {[query for query, _, _ in statements]}")
+            if not _is_lock_error(e):
+                # Constraint and SQL errors would fail again; never replay the transaction
+                raise
+            # Reconnect and retry
+            self._reset_connection()
+            return run(self._get_connection())
+
+    def _close_sync(self):
+        self._reset_connection()
+
+    async def _run(self, executor: ThreadPoolExecutor, func, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(func, *args))
+        finally:
+            DB_OPERATION_DURATION.observe(
+                time.perf_counter() - start,
+                operation="write" if executor is self._writer else "read"
+            )
+
+    # Async API
+
+    async def query(self, query: str, params: tuple = ()) -> List[tuple]:
+        """Execute a query and fetch all results"""
+        return await self._run(self._readers, self._query_sync, query, params, False)
+
+    async def query_one(self, query: str, params: tuple = ()) -> Optional[tuple]:
+        """Execute a query and fetch one result"""
+        return await self._run(self._readers, self._query_sync, query, params, True)
+
+    async def execute(self, query: str, params: tuple = ()) -> int:
+        """Execute and commit a write on the writer thread. Returns the affected row count"""
+        return await self._run(self._writer, self._write_sync, [(query, params, False)])
+
+    async def executemany(self, query: str, seq_of_params: Iterable[tuple]) -> int:
+        """Execute a write for every parameter tuple in a single transaction"""
+        return await self._run(self._writer, self._write_sync, [(query, list(seq_of_params), True)])
+
+    async def execute_batch(self, batches: Iterable[Tuple[str, List[tuple]]]) -> int:
+        """Run several executemany batches, in order, in a single transaction"""
+        statements = [(query, list(params), True) for query, params in batches]
+        if not statements:
+            return 0
+        return await self._run(self._writer, self._write_sync, statements)
+
+    async def get_bot_state(self) -> Dict[str, Any]:
         """Get all bot state values"""
         state = {}
         try:
-            self.cursor.execute("SELECT key, value FROM bot_state")
-            for key, value in self.cursor.fetchall():
+            for key, value in await self.query("SELECT key, value FROM bot_state"):
                 if key == 'leaderboard_message_id' or key == 'active_players_message_id':
                     state[key] = int(value) if value else None
                 else:
@@ -94,72 +377,106 @@ class AOE4Database:
         except Exception as e:
             logger.error(f"Error getting bot state: {e}")
             return {}
-    
-    def save_bot_state(self, key: str, value: str):
+
+    async def save_bot_state(self, key: str, value: str):
         """Save a bot state value"""
         try:
-            self.cursor.execute(
+            await self.execute(
                 "INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)",
                 (key, value)
             )
-            self.conn.commit()
         except Exception as e:
             logger.error(f"Error saving bot state: {e}")
-    
-    def execute(self, query: str, params: tuple = ()):
-        """Execute a SQL query"""
-        try:
-            return self.cursor.execute(query, params)
-        except Exception as e:
-            logger.error(f"Database error executing query: {e}")
-            logger.error(f"Query: {query}, Params: {params}")
-            # Reconnect and retry
-            self.close()
-            self.init_db()
-            return self.cursor.execute(query, params)
-    
-    def query(self, query: str, params: tuple = ()) -> List[tuple]:
-        """Execute a query and fetch all results"""
-        try:
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Database error querying: {e}")
-            logger.error(f"Query: {query}, Params: {params}")
-            # Reconnect and retry
-            self.close()
-            self.init_db()
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
-    
-    def query_one(self, query: str, params: tuple = ()) -> Optional[tuple]:
-        """Execute a query and fetch one result"""
+
+    async def close(self):
+        """Finish pending work and close every connection"""
         try:
-            self.cursor.execute(query, params)
-            return self.cursor.fetchone()
+            await self._run(self._writer, self._close_sync)
         except Exception as e:
-            logger.error(f"Database error querying one: {e}")
-            logger.error(f"Query: {query}, Params: {params}")
-            # Reconnect and retry
-            self.close()
-            self.init_db()
-            self.cursor.execute(query, params)
-            return self.cursor.fetchone()
-    
-    def commit(self):
-        """Commit changes to the database"""
+            logger.error(f"Error closing database: {e}")
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error closing database: {e}")
+
+class WriteBehindBuffer:
+    """Collects writes and flushes them to the database in one transaction.
+
+    A write added with a key replaces any pending write with the same key, so
+    only the latest value per row is written. Pending writes are grouped by
+    query and flushed with executemany once max_size writes are pending,
+    max_delay seconds after the first pending write, or on an explicit flush."""
+
+    def __init__(self, db: AOE4Database, max_size=WRITE_BUFFER_MAX_SIZE, max_delay=WRITE_BUFFER_MAX_DELAY):
+        self.db = db
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: "OrderedDict[Any, Tuple[str, tuple]]" = OrderedDict()
+        self._sequence = itertools.count()
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self.flush_count = 0
+        self.written_count = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, query: str, params: tuple, key: Any = None):
+        """Queue a write; flushes first if the buffer is full"""
+        if key is None:
+            key = ('_unkeyed', next(self._sequence))
+        else:
+            self._pending.pop(key, None)
+        self._pending[key] = (query, params)
+
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
         try:
-            self.conn.commit()
+            await self.flush()
         except Exception as e:
-            logger.error(f"Database error committing: {e}")
-            # Reconnect and retry
-            self.close()
-            self.init_db()
-    
-    def close(self):
-        """Close the database connection"""
+            logger.error(f"Error flushing write buffer: {e}")
+
+    async def flush(self) -> int:
+        """Write everything pending in one transaction. Returns the affected row count"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, OrderedDict()
+
+            # Group by query; relative order within each query is preserved
+            batches: Dict[str, List[tuple]] = OrderedDict()
+            for query, params in pending.values():
+                batches.setdefault(query, []).append(params)
+
+            try:
+                rowcount = await self.db.execute_batch(batches.items())
+            except Exception:
+                # execute_batch already retried once on a fresh connection;
+                # requeueing would let one bad write block every later flush
+                logger.error(f"Dropped {len(pending)} buffered writes after a failed flush")
+                raise
+
+            self.flush_count += 1
+            self.written_count += len(pending)
+            logger.debug(f"Flushed {len(pending)} buffered writes in {len(batches)} batches")
+            return rowcount
+
+    async def close(self):
+        """Stop the flush timer and write out anything still pending"""
+        if self._timer and not self._timer.done() and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
         try:
-            if self.conn:
-                self.conn.close()
+            await self.flush()
         except Exception as e:
-            logger.error(f"Error closing database: {e}")
\ No newline at end of file
+            logger.error(f"Error flushing write buffer on close: {e}")
\ No newline at end of file
@@ -0,0 +1,248 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from bs4 import Tag
+
+# Regexes compiled once and shared by every extraction
+TITLE_PREFIX_RE = re.compile(r'^(Age of Empires IV:?\s*)')
+PAGE_TITLE_SUFFIX_RE = re.compile(r'\s*\|\s*Age of Empires.*$')
+AUTHOR_PREFIX_RE = re.compile(r'^by\s+', re.IGNORECASE)
+DATE_TEXT_RES = (
+    re.compile(r'(\w+ \d{1,2}, 20\d{2})'),  # March 10, 2025
+    re.compile(r'(\d{1,2} \w+ 20\d{2})'),    # 10 March 2025
+    re.compile(r'(\d{2}/\d{2}/20\d{2})')     # 03/10/2025
+)
+SKIP_PARENT_CLASS_RE = re.compile(r'nav|menu|sidebar|footer|comment')
+SKIP_PARENT_NAMES = frozenset({'nav', 'menu', 'sidebar', 'footer', 'comment'})
+
+# Ancestor context flags tracked while walking the tree
+IN_ARTICLE = 1
+IN_MAIN = 2
+IN_ARTICLE_IMAGE = 4
+IN_FEATURED_IMAGE = 8
+IN_POST_THUMBNAIL = 16
+IN_BREADCRUMBS = 32
+
+CLASS_FLAGS = {
+    'article-image': IN_ARTICLE_IMAGE,
+    'featured-image': IN_FEATURED_IMAGE,
+    'post-thumbnail': IN_POST_THUMBNAIL,
+    'breadcrumbs': IN_BREADCRUMBS,
+    'breadcrumb': IN_BREADCRUMBS
+}
+NAME_FLAGS = {'article': IN_ARTICLE, 'main': IN_MAIN}
+
+def _has_class(cls):
+    return lambda tag, classes, ctx: cls in classes
+
+# Per-field selector chains in priority order. Each entry is (css, matcher) where
+# matcher(tag, classes, ctx) tests one element given its ancestors' context flags.
+# The css strings mirror the legacy select_one chains in benchmarks/legacy_extraction.py.
+SELECTOR_PROFILES = {
+    'title': (
+        ('article h1', lambda tag, classes, ctx: tag.name == 'h1' and ctx & IN_ARTICLE),
+        ('main h1', lambda tag, classes, ctx: tag.name == 'h1' and ctx & IN_MAIN),
+        ('.article-title', _has_class('article-title')),
+        ('.entry-title', _has_class('entry-title')),
+        ('h1', lambda tag, classes, ctx: tag.name == 'h1')
+    ),
+    'date': (
+        ('meta[property="article:published_time"]',
+         lambda tag, classes, ctx: tag.name == 'meta' and tag.get('property') == 'article:published_time'),
+        ('.article-date', _has_class('article-date')),
+        ('.post-date', _has_class('post-date')),
+        ('time', lambda tag, classes, ctx: tag.name == 'time')
+    ),
+    'author': (
+        ('.author', _has_class('author')),
+        ('.byline', _has_class('byline')),
+        ('.post-author', _has_class('post-author')),
+        ('meta[name="author"]', lambda tag, classes, ctx: tag.name == 'meta' and tag.get('name') == 'author')
+    ),
+    'content': (
+        ('article .content', lambda tag, classes, ctx: 'content' in classes and ctx & IN_ARTICLE),
+        ('.article-content', _has_class('article-content')),
+        ('.entry-content', _has_class('entry-content')),
+        ('.post-content', _has_class('post-content')),
+        ('main', lambda tag, classes, ctx: tag.name == 'main')
+    ),
+    'image': (
+        ('.article-image img', lambda tag, classes, ctx: tag.name == 'img' and ctx & IN_ARTICLE_IMAGE),
+        ('.featured-image img', lambda tag, classes, ctx: tag.name == 'img' and ctx & IN_FEATURED_IMAGE),
+        ('article img', lambda tag, classes, ctx: tag.name == 'img' and ctx & IN_ARTICLE),
+        ('.post-thumbnail img', lambda tag, classes, ctx: tag.name == 'img' and ctx & IN_POST_THUMBNAIL),
+        ('main img', lambda tag, classes, ctx: tag.name == 'img' and ctx & IN_MAIN)
+    ),
+    'category': (
+        ('.category', _has_class('category')),
+        ('.article-category', _has_class('article-category')),
+        ('.post-category', _has_class('post-category'))
+    )
+}
+
+# site -> {field: rank of the selector that hit last time}
+_site_profiles: Dict[str, Dict[str, int]] = {}
+
+def _walk(soup, max_ranks: Dict[str, int]):
+    """Visit every element once, recording the best selector hit per field.
+
+    Only selectors ranked below max_ranks[field] are tried for that field."""
+    best: Dict[str, Tuple[int, Tag]] = {}
+    paragraphs = []
+    page_title = None
+    breadcrumb = None
+
+    stack = [(child, 0, ()) for child in reversed(soup.contents) if isinstance(child, Tag)]
+    while stack:
+        tag, ctx, containers = stack.pop()
+        name = tag.name
+        classes = tag.get('class') or ()
+
+        for field, selectors in SELECTOR_PROFILES.items():
+            limit = max_ranks.get(field, len(selectors))
+            for rank in range(limit):
+                if selectors[rank][1](tag, classes, ctx):
+                    if field == 'content':
+                        # Paragraphs remember every candidate container they sit in
+                        containers = containers + (id(tag),)
+                    if field not in best or rank < best[field][0]:
+                        best[field] = (rank, tag)
+                    break
+
+        if name == 'p':
+            paragraphs.append((tag, containers))
+        elif name == 'title' and page_title is None:
+            page_title = tag
+        elif name == 'a' and breadcrumb is None and ctx & IN_BREADCRUMBS and 'category' in tag.get('href', ''):
+            breadcrumb = tag
+
+        child_ctx = ctx | NAME_FLAGS.get(name, 0)
+        for cls in classes:
+            child_ctx |= CLASS_FLAGS.get(cls, 0)
+        stack.extend(
+            (child, child_ctx, containers)
+            for child in reversed(tag.contents) if isinstance(child, Tag)
+        )
+
+    return best, paragraphs, page_title, breadcrumb
+
+def _extract_title(tag, page_title):
+    if tag is not None:
+        return TITLE_PREFIX_RE.sub('', tag.get_text(strip=True))
+    if page_title is not None:
+        title = PAGE_TITLE_SUFFIX_RE.sub('', page_title.get_text(strip=True))
+        return TITLE_PREFIX_RE.sub('', title)
+    return None
+
+def _extract_date(tag, soup):
+    if tag is not None:
+        if tag.name != 'meta':
+            return tag.get_text(strip=True)
+        date_str = tag.get('content')
+        if date_str:
+            try:
+                return datetime.fromisoformat(date_str.replace('Z', '+00:00')).strftime("%B %d, %Y")
+            except ValueError:
+                pass
+
+    text = soup.get_text()
+    for pattern in DATE_TEXT_RES:
+        match = pattern.search(text)
+        if match:
+            return match.group(1)
+    return "Unknown date"
+
+def _extract_author(tag):
+    if tag is None:
+        return None
+    if tag.name == 'meta':
+        return tag.get('content')
+    return AUTHOR_PREFIX_RE.sub('', tag.get_text(strip=True))
+
+def _extract_content(container, paragraphs):
+    filtered = []
+    for p, containers in paragraphs:
+        if container is not None and id(container) not in containers:
+            continue
+
+        # Skip paragraphs in navigation, sidebar, footer, etc.
+        parent = p.parent
+        if parent.name in SKIP_PARENT_NAMES:
+            continue
+        parent_classes = parent.get('class')
+        if parent_classes and SKIP_PARENT_CLASS_RE.search(' '.join(parent_classes)):
+            continue
+
+        text = p.get_text(strip=True)
+        if not text:
+            continue
+        # Skip very short paragraphs that might be buttons or navigation
+        if len(text) < 10 and not any(child.name == 'a' for child in p.children):
+            continue
+        filtered.append(text)
+
+    if not filtered:
+        return None, None
+
+    full_content = '\n\n'.join(filtered)
+    preview_paragraphs = []
+    preview_length = 0
+    for text in filtered:
+        preview_paragraphs.append(text)
+        preview_length += len(text)
+        if preview_length > 800:
+            break
+
+    preview = '\n\n'.join(preview_paragraphs)
+    if len(preview) < len(full_content):
+        preview += '\n\n... [Read more on the website]'
+    return full_content, preview
+
+def _extract_image(tag):
+    if tag is None or not tag.get('src'):
+        return None
+    src = tag['src']
+    if not src.startswith('http'):
+        src = f"https://www.ageofempires.com{src}"
+    return src
+
+def _extract_category(tag, breadcrumb):
+    if tag is not None:
+        return tag.get_text(strip=True)
+    if breadcrumb is not None:
+        return breadcrumb.get_text(strip=True)
+    return "Uncategorized"
+
+def extract_article(soup, url: Optional[str] = None) -> Dict[str, Any]:
+    """Extract title, date, author, content, image and category in one pass.
+
+    Selector hits are learned per site: later pages from the same site only
+    try selectors up to the one that hit before, and fall back to the full
+    chains (relearning) only if a learned selector stops matching."""
+    site = urlparse(url).netloc if url else ''
+    learned = _site_profiles.get(site, {})
+
+    best, paragraphs, page_title, breadcrumb = _walk(
+        soup, {field: rank + 1 for field, rank in learned.items()}
+    )
+    if learned and any(field not in best for field in learned):
+        # The site's layout changed; walk again with the full fallback chains
+        best, paragraphs, page_title, breadcrumb = _walk(soup, {})
+
+    _site_profiles[site] = {field: rank for field, (rank, _) in best.items()}
+
+    def hit(field):
+        return best[field][1] if field in best else None
+
+    full_content, preview = _extract_content(hit('content'), paragraphs)
+    return {
+        'title': _extract_title(hit('title'), page_title),
+        'date': _extract_date(hit('date'), soup),
+        'author': _extract_author(hit('author')),
+        'content': full_content,
+        'preview': preview,
+        'image_url': _extract_image(hit('image')),
+        'category': _extract_category(hit('category'), breadcrumb)
+    }
@@ -0,0 +1,194 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import *
+from utils import parse_api_time
+
+logger = logging.getLogger('AOE4RankBot')
+
+GAME_SEEN = "seen"          # Known, but not confirmed by a poll since startup
+GAME_ONGOING = "ongoing"
+GAME_FINISHED = "finished"  # Final; never parsed or written again
+
+class TrackedGame:
+    """One game and every player's team, civilization and result, parsed once from the API"""
+
+    __slots__ = ('game_id', 'kind', 'map', 'state', 'started_at', 'finished_at', 'last_seen_at', 'players')
+
+    def __init__(self, game_id, kind, map, state, started_at, finished_at, last_seen_at, players):
+        self.game_id = game_id
+        self.kind = kind
+        self.map = map
+        self.state = state
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.last_seen_at = last_seen_at
+        self.players: Dict[str, tuple] = players  # profile_id -> (team index, civilization, result)
+
+    @staticmethod
+    def parse_players(game) -> Dict[str, tuple]:
+        players = {}
+        for team_idx, team in enumerate(game.get('teams', [])):
+            for player in team:
+                player_data = player.get('player', {})
+                players[str(player_data.get('profile_id'))] = (
+                    team_idx, player_data.get('civilization'), player_data.get('result')
+                )
+        return players
+
+    @classmethod
+    def from_api(cls, game, now) -> 'TrackedGame':
+        return cls(
+            game.get('game_id'), game.get('kind', 'Unknown'), game.get('map', 'Unknown Map'), GAME_SEEN,
+            parse_api_time(game.get('started_at')) or now, None, now, cls.parse_players(game)
+        )
+
+    def finish(self, game, now):
+        """Record the final results"""
+        self.players = self.parse_players(game)
+        self.finished_at = parse_api_time(game.get('updated_at')) or now
+        self.state = GAME_FINISHED
+
+    def to_row(self) -> tuple:
+        started_at, finished_at, last_seen_at = (
+            int(value) if value is not None else None
+            for value in (self.started_at, self.finished_at, self.last_seen_at)
+        )
+        return (
+            self.game_id, self.kind, self.map, self.state, started_at, finished_at, last_seen_at,
+            json.dumps({pid: list(player) for pid, player in self.players.items()})
+        )
+
+    @classmethod
+    def from_row(cls, row) -> 'TrackedGame':
+        game_id, kind, map, state, started_at, finished_at, last_seen_at, players = row
+        players = {pid: tuple(player) for pid, player in json.loads(players or '{}').items()}
+        return cls(game_id, kind, map, state, started_at, finished_at, last_seen_at, players)
+
+class GameTracker:
+    """Games of registered players moving through seen -> ongoing -> finished.
+
+    Polls feed observe(); only games that are new or change state are parsed,
+    and each is written to the games table as it changes. Finished games are
+    kept in memory for the recently finished window and stay in the table;
+    their ids are remembered longer so a quiet player's last game is not
+    parsed and written again on every poll."""
+
+    def __init__(self, db, recent_minutes: float = GAME_RECENT_MINUTES,
+                 ongoing_expiry_minutes: float = GAME_ONGOING_EXPIRY_MINUTES,
+                 finished_ids_max: int = GAME_FINISHED_IDS_MAX):
+        self.db = db
+        self.recent_seconds = recent_minutes * 60
+        self.ongoing_expiry_seconds = ongoing_expiry_minutes * 60
+        self.finished_ids_max = finished_ids_max
+        self.games: Dict[int, TrackedGame] = {}
+        self.latest: Dict[str, int] = {}  # ingame_id -> game id of their most recent game
+        self.finished_ids: OrderedDict = OrderedDict()  # Most recently finished last
+
+    async def load(self):
+        """Load unfinished and recently finished games at startup.
+
+        Unfinished games start as seen until a poll confirms them."""
+        await self.sync()
+        for game in self.games.values():
+            if game.state != GAME_FINISHED:
+                game.state = GAME_SEEN
+
+        rows = await self.db.query(
+            "SELECT game_id FROM games WHERE state = ? ORDER BY finished_at DESC LIMIT ?",
+            (GAME_FINISHED, self.finished_ids_max)
+        )
+        for (game_id,) in reversed(rows):
+            self.finished_ids[game_id] = None
+        logger.info(f"Loaded {len(self.games)} tracked games, {len(self.finished_ids)} finished game ids")
+
+    def _remember_finished(self, game_id):
+        self.finished_ids[game_id] = None
+        self.finished_ids.move_to_end(game_id)
+        while len(self.finished_ids) > self.finished_ids_max:
+            self.finished_ids.popitem(last=False)
+
+    async def sync(self):
+        """Replace the in-memory games with the games table as written by the poller process"""
+        cutoff = time.time() - self.recent_seconds
+        rows = await self.db.query("""
+            SELECT game_id, kind, map, state, started_at, finished_at, last_seen_at, players
+            FROM games
+            WHERE finished_at IS NULL OR finished_at >= ?
+        """, (cutoff,))
+        self.games = {row[0]: TrackedGame.from_row(row) for row in rows}
+
+        self.latest = {}
+        for game in sorted(self.games.values(), key=lambda g: g.started_at or 0):
+            for profile_id in game.players:
+                self.latest[profile_id] = game.game_id
+
+    async def observe(self, games_by_player, now=None):
+        """Advance the tracked games with one poll's ingame_id -> games (newest first)"""
+        now = now or time.time()
+        changed = {}
+        for ingame_id, games in games_by_player.items():
+            if not games:
+                continue
+            data = games[0]
+            game = self.games.get(data.get('game_id'))
+            if game is None:
+                if data.get('game_id') in self.finished_ids:
+                    continue  # Already recorded as finished and past the recent window
+                game = self.games[data.get('game_id')] = TrackedGame.from_api(data, now)
+            if game.state != GAME_FINISHED:
+                game.last_seen_at = now
+                if data.get('ongoing'):
+                    game.state = GAME_ONGOING
+                else:
+                    game.finish(data, now)
+                    self._remember_finished(game.game_id)
+                changed[game.game_id] = game
+            self.latest[str(ingame_id)] = game.game_id
+
+        expired = self._prune(now)
+        if changed:
+            await self.db.executemany("""
+                INSERT OR REPLACE INTO games
+                (game_id, kind, map, state, started_at, finished_at, last_seen_at, players)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [game.to_row() for game in changed.values()])
+        if expired:
+            await self.db.executemany("DELETE FROM games WHERE game_id = ?", [(game_id,) for game_id in expired])
+
+    def _prune(self, now) -> List[int]:
+        """Forget finished games past the recent window and unfinished games no poll has seen
+        for a long time. Returns the ids of the unfinished ones, which never got a result"""
+        expired = []
+        count = len(self.games)
+        for game_id, game in list(self.games.items()):
+            if game.state == GAME_FINISHED:
+                if game.finished_at < now - self.recent_seconds:
+                    del self.games[game_id]
+            elif game.last_seen_at < now - self.ongoing_expiry_seconds:
+                del self.games[game_id]
+                expired.append(game_id)
+        if len(self.games) < count:
+            self.latest = {pid: game_id for pid, game_id in self.latest.items() if game_id in self.games}
+        return expired
+
+    def live_game(self, ingame_id, now=None) -> Optional[TrackedGame]:
+        """The ongoing game a player is in, if a poll confirmed it recently"""
+        now = now or time.time()
+        game = self.games.get(self.latest.get(str(ingame_id)))
+        if game and game.state == GAME_ONGOING and now - game.last_seen_at <= LIVE_GAMES_MAX_AGE_SECONDS:
+            return game
+        return None
+
+    def recent_finished(self, now=None) -> List[TrackedGame]:
+        """Games finished within the recent window, newest first"""
+        now = now or time.time()
+        games = [
+            game for game in self.games.values()
+            if game.state == GAME_FINISHED and now - game.finished_at <= self.recent_seconds
+        ]
+        games.sort(key=lambda game: game.finished_at, reverse=True)
+        return games
@@ -0,0 +1,106 @@
+import json
+import logging
+from typing import Dict, List, Optional
+
+from config import *
+
+logger = logging.getLogger('AOE4RankBot')
+
+GUILD_CONFIG_COLUMNS = (
+    'guild_id', 'rank_channel_id', 'log_channel_id', 'leaderboard_channel_id',
+    'active_players_channel_id', 'rank_roles', 'leaderboard_message_id', 'active_players_message_id'
+)
+
+class GuildConfig:
+    """Channels, rank roles and bot message ids for one guild"""
+
+    def __init__(self, guild_id, rank_channel_id=None, log_channel_id=None, leaderboard_channel_id=None,
+                 active_players_channel_id=None, rank_roles=None, leaderboard_message_id=None,
+                 active_players_message_id=None):
+        self.guild_id = guild_id
+        self.rank_channel_id = rank_channel_id
+        self.log_channel_id = log_channel_id
+        self.leaderboard_channel_id = leaderboard_channel_id
+        self.active_players_channel_id = active_players_channel_id
+        self.rank_roles: Dict[str, int] = dict(rank_roles or {})
+        self.leaderboard_message_id = leaderboard_message_id
+        self.active_players_message_id = active_players_message_id
+        # Runtime only: cached partial message and last rendered embed fingerprint
+        self.active_players_message = None
+        self.active_players_fingerprint = None
+
+    def to_row(self) -> tuple:
+        return (
+            self.guild_id, self.rank_channel_id, self.log_channel_id, self.leaderboard_channel_id,
+            self.active_players_channel_id, json.dumps(self.rank_roles),
+            self.leaderboard_message_id, self.active_players_message_id
+        )
+
+    @classmethod
+    def from_row(cls, row) -> 'GuildConfig':
+        values = dict(zip(GUILD_CONFIG_COLUMNS, row))
+        values['rank_roles'] = {rank: int(role_id) for rank, role_id in json.loads(values['rank_roles'] or '{}').items()}
+        return cls(**values)
+
+class GuildConfigStore:
+    """Per-guild configuration stored in guild_config and cached in memory"""
+
+    def __init__(self, db):
+        self.db = db
+        self._configs: Dict[int, GuildConfig] = {}
+
+    async def load(self):
+        rows = await self.db.query(f"SELECT {', '.join(GUILD_CONFIG_COLUMNS)} FROM guild_config")
+        self._configs = {row[0]: GuildConfig.from_row(row) for row in rows}
+        logger.info(f"Loaded configuration for {len(self._configs)} guilds")
+
+    def get(self, guild_id) -> Optional[GuildConfig]:
+        return self._configs.get(guild_id)
+
+    def all(self) -> List[GuildConfig]:
+        return list(self._configs.values())
+
+    def get_or_create(self, guild_id) -> GuildConfig:
+        """Cached config for a guild, or a new unsaved empty one"""
+        return self._configs.get(guild_id) or GuildConfig(guild_id)
+
+    async def save(self, config: GuildConfig):
+        await self.db.execute(
+            f"INSERT OR REPLACE INTO guild_config ({', '.join(GUILD_CONFIG_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in GUILD_CONFIG_COLUMNS)})",
+            config.to_row()
+        )
+        self._configs[config.guild_id] = config
+
+    async def adopt_legacy_guild(self, bot):
+        """Give the guild owning the config.py channels a config, and hand it pre-multi-guild players.
+
+        Players registered before guild support have guild_id 0; they belong to the
+        guild that RANK_CHANNEL_ID lives in."""
+        channel = bot.get_channel(RANK_CHANNEL_ID)
+        if not channel:
+            return
+        guild_id = channel.guild.id
+
+        if guild_id not in self._configs:
+            state = await self.db.get_bot_state()
+            await self.save(GuildConfig(
+                guild_id,
+                rank_channel_id=RANK_CHANNEL_ID,
+                log_channel_id=LOG_CHANNEL_ID,
+                leaderboard_channel_id=LEADERBOARD_CHANNEL_ID,
+                active_players_channel_id=ACTIVE_PLAYERS_CHANNEL_ID,
+                rank_roles=RANK_ROLES,
+                leaderboard_message_id=state.get('leaderboard_message_id'),
+                active_players_message_id=state.get('active_players_message_id')
+            ))
+            logger.info(f"Created guild configuration for {guild_id} from config.py")
+
+        # A legacy row that clashes with a registration the guild already has
+        # (same account re-registered since the upgrade) is superseded by it
+        adopted = await self.db.execute("UPDATE OR IGNORE players SET guild_id = ? WHERE guild_id = 0", (guild_id,))
+        dropped = await self.db.execute("DELETE FROM players WHERE guild_id = 0")
+        if adopted:
+            logger.info(f"Assigned {adopted} pre-multi-guild player registrations to guild {guild_id}")
+        if dropped:
+            logger.info(f"Dropped {dropped} pre-multi-guild registrations already registered in guild {guild_id}")
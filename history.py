@@ -0,0 +1,98 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import *
+
+logger = logging.getLogger('AOE4RankBot')
+
+# Only insert a snapshot when one of these differs from the player's latest row
+# (global rank drifts constantly and would defeat deduplication on its own)
+INSERT_SNAPSHOT = """
+    INSERT INTO rating_history (ingame_id, mode, rating, rank, rank_level, wins, losses, ts)
+    SELECT ?, ?, ?, ?, ?, ?, ?, ?
+    WHERE NOT EXISTS (
+        SELECT 1 FROM (
+            SELECT rating, rank_level, wins, losses FROM rating_history
+            WHERE ingame_id = ? AND mode = ?
+            ORDER BY ts DESC LIMIT 1
+        ) AS latest
+        WHERE latest.rating IS ? AND latest.rank_level IS ?
+          AND latest.wins IS ? AND latest.losses IS ?
+    )
+"""
+
+def snapshot_params(ingame_id, mode, mode_data, ts=None):
+    """Build the INSERT_SNAPSHOT parameters for one ranked mode of a profile"""
+    ingame_id = str(ingame_id)
+    rating = mode_data.get('rating', 0)
+    rank_level = mode_data.get('rank_level', 'unranked')
+    wins = mode_data.get('wins_count', 0)
+    losses = mode_data.get('losses_count', 0)
+    return (
+        ingame_id, mode, rating, mode_data.get('rank', 0), rank_level, wins, losses,
+        int(ts if ts is not None else time.time()),
+        ingame_id, mode, rating, rank_level, wins, losses
+    )
+
+async def record_snapshots(db, ingame_id, data, buffer=None):
+    """Record a rating snapshot for every ranked mode in a profile. Returns rows inserted.
+
+    With a WriteBehindBuffer the snapshots are queued instead and 0 is returned."""
+    modes = data.get('modes', {})
+    now = time.time()
+    params = [
+        snapshot_params(ingame_id, mode, modes[mode], now)
+        for mode in LEADERBOARD_MODES
+        if modes.get(mode)
+    ]
+    if not params:
+        return 0
+    if buffer is not None:
+        for snapshot in params:
+            await buffer.add(INSERT_SNAPSHOT, snapshot)
+        return 0
+    try:
+        return await db.executemany(INSERT_SNAPSHOT, params)
+    except Exception as e:
+        logger.error(f"Error recording rating history for {ingame_id}: {e}")
+        return 0
+
+async def get_rating_summary(db, ingame_id, mode, days) -> Optional[Dict[str, Any]]:
+    """Rating change, peak and low over the last `days` days from stored snapshots"""
+    since = int(time.time() - days * 86400)
+    ingame_id = str(ingame_id)
+
+    current = await db.query_one("""
+        SELECT rating FROM rating_history
+        WHERE ingame_id = ? AND mode = ?
+        ORDER BY ts DESC LIMIT 1
+    """, (ingame_id, mode))
+    if not current:
+        return None
+
+    # The snapshot in effect when the window opened, else the first one inside it
+    baseline = await db.query_one("""
+        SELECT rating FROM rating_history
+        WHERE ingame_id = ? AND mode = ? AND ts <= ?
+        ORDER BY ts DESC LIMIT 1
+    """, (ingame_id, mode, since))
+    window = await db.query_one("""
+        SELECT MAX(rating), MIN(rating),
+               (SELECT rating FROM rating_history
+                WHERE ingame_id = ? AND mode = ? AND ts > ?
+                ORDER BY ts ASC LIMIT 1)
+        FROM rating_history
+        WHERE ingame_id = ? AND mode = ? AND ts > ?
+    """, (ingame_id, mode, since, ingame_id, mode, since))
+
+    peak, low, first_in_window = window if window else (None, None, None)
+    start = baseline[0] if baseline else first_in_window
+    ratings = [r for r in (start, peak, low) if r is not None]
+
+    return {
+        'current': current[0],
+        'delta': current[0] - start if start is not None else 0,
+        'peak': max(ratings) if ratings else current[0],
+        'low': min(ratings) if ratings else current[0]
+    }
@@ -0,0 +1,103 @@
+import aiohttp
+import logging
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config import *
+from metrics import HTTP_REQUEST_DURATION
+
+logger = logging.getLogger('AOE4RankBot')
+
+class HTTPSession:
+    """Long-lived pooled aiohttp session shared by every outbound request"""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        # url -> {'etag': ..., 'last_modified': ...} from the last 200 response
+        self.validators: Dict[str, Dict[str, str]] = {}
+
+    async def start(self):
+        """Create the underlying session (must run inside the event loop)"""
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+        logger.info("HTTP session started")
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it on first use"""
+        if not self._session or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any, Mapping[str, str]]:
+        """GET a URL and decode JSON. Returns (status, data, response headers);
+        data is None unless status is 200"""
+        session = await self.get_session()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            async with session.get(url, params=params, headers=headers) as response:
+                status = response.status
+                if response.status == 200:
+                    return response.status, await response.json(), response.headers
+                return response.status, None, response.headers
+        finally:
+            self._observe(url, status, start)
+
+    async def get_text(self, url: str, headers: Optional[Dict[str, str]] = None,
+                       conditional: bool = False) -> Tuple[int, Optional[str]]:
+        """GET a URL as text. Returns (status, text); text is None unless status is 200.
+
+        With conditional, stored ETag / Last-Modified validators are sent and an
+        unchanged resource comes back as (304, None)."""
+        request_headers = dict(headers or {})
+        if conditional:
+            validator = self.validators.get(url, {})
+            if validator.get('etag'):
+                request_headers['If-None-Match'] = validator['etag']
+            if validator.get('last_modified'):
+                request_headers['If-Modified-Since'] = validator['last_modified']
+
+        session = await self.get_session()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            async with session.get(url, headers=request_headers) as response:
+                status = response.status
+                if response.status != 200:
+                    return response.status, None
+                text = await response.text()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if etag or last_modified:
+                    self.validators[url] = {'etag': etag, 'last_modified': last_modified}
+                else:
+                    self.validators.pop(url, None)
+                return response.status, text
+        finally:
+            self._observe(url, status, start)
+
+    def _observe(self, url: str, status, start: float):
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            host=urlsplit(url).hostname or "unknown",
+            status=status
+        )
+
+    async def close(self):
+        """Close the session and release pooled connections"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP session closed")
+        self._session = None
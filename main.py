@@ -3,52 +3,114 @@ from discord.ext import commands, tasks
 import logging
 import os
 import asyncio
-from dotenv import load_dotenv
+import hashlib
+import json
+import time
 
 # Import our modules
 from config import *
-from database import AOE4Database
+from database import AOE4Database, WriteBehindBuffer
+from http_client import HTTPSession
+from cache import ProfileCache
+from guilds import GuildConfigStore
+from game_tracker import GameTracker
+from snapshot import save_snapshot, restore_snapshot
+from scheduler import RequestScheduler
+from news import shutdown_parser
+from metrics import MetricsServer, instrument_discord_http, register_bot_gauges, monitor_event_loop_lag, TIME_TO_READY
 from commands import register_commands
 from tasks import (
     update_all_players,
+    refresh_player_profiles,
+    reconcile_guild_roles,
     update_active_players_status,
     check_aoe4_news,
-    cleanup_deleted_news
+    post_queued_news,
+    cleanup_deleted_news,
+    snapshot_state,
+    load_player_activity,
+    start_loops
 )
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
 logger = logging.getLogger('AOE4RankBot')
 
-# Load environment variables
-load_dotenv()
-
 class AOE4RankBot(commands.Bot):
     def __init__(self):
+        self.started_at = time.perf_counter()
         super().__init__(command_prefix="!", intents=get_intents())
-        self.leaderboard_message_id = None
-        self.active_players_message_id = None
         self.db = AOE4Database()
-        self.load_state()
-
-    def load_state(self):
-        state = self.db.get_bot_state()
-        self.leaderboard_message_id = state.get('leaderboard_message_id')
-        self.active_players_message_id = state.get('active_players_message_id')
+        self.guild_configs = GuildConfigStore(self.db)
+        self.write_buffer = WriteBehindBuffer(self.db)
+        self.http_session = HTTPSession()
+        self.api_scheduler = RequestScheduler(self.http_session)
+        self.profile_cache = ProfileCache()
+        self.game_tracker = GameTracker(self.db)
+        self.metrics_server = MetricsServer()
+        self.snapshot_path = SNAPSHOT_PATH
+        self.lag_monitor = None
+        self.loop_starter = None
+        self.setup_seconds = None
+        self.ready = False
 
-    def save_state(self):
-        if self.leaderboard_message_id:
-            self.db.save_bot_state('leaderboard_message_id', str(self.leaderboard_message_id))
-        if self.active_players_message_id:
-            self.db.save_bot_state('active_players_message_id', str(self.active_players_message_id))
+    def command_tree_hash(self):
+        """Hash of the global command payload Discord would receive from tree.sync()"""
+        payload = []
+        for command in self.tree.get_commands():
+            try:
+                payload.append(command.to_dict(self.tree))
+            except TypeError:
+                payload.append(command.to_dict())  # discord.py < 2.4
+        payload.sort(key=lambda command: command['name'])
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
 
-    async def setup_hook(self):
+    async def sync_commands(self):
+        """Sync slash commands only when they changed since the last sync"""
+        tree_hash = self.command_tree_hash()
+        state = await self.db.get_bot_state()
+        if state.get('command_tree_hash') == tree_hash:
+            logger.info("Slash commands unchanged, skipping sync")
+            return
         await self.tree.sync()
+        await self.db.save_bot_state('command_tree_hash', tree_hash)
         logger.info("Slash commands synced")
 
+    async def setup_hook(self):
+        instrument_discord_http(self.http)
+        register_bot_gauges(self)
+        self.lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+        if METRICS_ENABLED:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Could not start metrics endpoint: {e}")
+
+        # Independent startup work runs concurrently
+        startup = [self.guild_configs.load(), self.http_session.start(), self.sync_commands()]
+        if BOT_MODE == "all":
+            startup += [load_player_activity(self), self.game_tracker.load()]
+        await asyncio.gather(*startup)
+        # After the database state, so the snapshot only adds what the tables lack
+        if SNAPSHOT_ENABLED:
+            await restore_snapshot(self)
+        self.setup_seconds = time.perf_counter() - self.started_at
+
     async def close(self):
-        self.save_state()
-        self.db.close()
+        for task in (self.lag_monitor, self.loop_starter):
+            if task:
+                task.cancel()
+        await self.metrics_server.stop()
+        if SNAPSHOT_ENABLED and self.ready:
+            try:
+                await save_snapshot(self)
+            except Exception as e:
+                logger.error(f"Error saving state snapshot: {e}")
+        await self.api_scheduler.close()
+        await self.http_session.close()
+        shutdown_parser()
+        await self.write_buffer.close()
+        await self.db.close()
         await super().close()
 
 def get_intents():
@@ -57,90 +119,64 @@ def get_intents():
     intents.message_content = True
     return intents
 
-async def on_message_delete(bot, message):
+async def handle_message_delete(bot, message):
     if message.channel.id != PATCH_NOTES_CHANNEL_ID:
         return
         
     # Check if this was a news post
-    post = bot.db.query_one("SELECT post_id FROM aoe4_news WHERE message_id = ?", (str(message.id),))
+    post = await bot.db.query_one("SELECT post_id FROM aoe4_news WHERE message_id = ?", (str(message.id),))
     
     if post:
         post_id = post[0]
         logger.info(f"News post {post_id} message was deleted, removing from database")
-        bot.db.execute("DELETE FROM aoe4_news WHERE post_id = ?", (post_id,))
-        bot.db.commit()
+        await bot.db.execute("DELETE FROM aoe4_news WHERE post_id = ?", (post_id,))
 
-async def on_ready(bot):
+async def handle_ready(bot):
+    # on_ready fires again after every reconnect; startup runs only once
+    if bot.ready:
+        logger.info(f"Reconnected as {bot.user}")
+        return
+    bot.ready = True
     logger.info(f"Bot logged in as {bot.user}")
-    
-    # Make sure the database is properly initialized
-    bot.db.update_news_table_schema()
-    
-    # Start background tasks
-    update_all_players.start(bot)
-    update_active_players_status.start(bot)
-    check_aoe4_news.start(bot)
-    cleanup_deleted_news.start(bot)
-    
-    # Check for latest news on startup
-    logger.info("Checking for latest AOE4 news on startup...")
+
+    # The guild owning the config.py channels keeps working without /setup
     try:
-        from news import fetch_aoe4_news, post_aoe4_news
-        
-        # Check for latest patch, then latest announcement
-        patch_articles = await fetch_aoe4_news(news_type="patch")
-        if patch_articles and len(patch_articles) > 0:
-            latest_patch = patch_articles[0]
-            
-            # Check if already posted
-            url_hash = latest_patch.get('url_hash')
-            existing = None
-            
-            if url_hash:
-                existing = bot.db.query_one(
-                    "SELECT post_id FROM aoe4_news WHERE url_hash = ?", 
-                    (url_hash,)
-                )
-            
-            if not existing:
-                success = await post_aoe4_news(bot, latest_patch)
-                if success:
-                    logger.info(f"Posted latest AOE4 patch on startup: {latest_patch['title']}")
-                    return
-        
-        # If no patch was posted, try with announcement
-        announcement_articles = await fetch_aoe4_news(news_type="announcement")
-        if announcement_articles and len(announcement_articles) > 0:
-            latest_announcement = announcement_articles[0]
-            
-            # Check if already posted
-            url_hash = latest_announcement.get('url_hash')
-            existing = None
-            
-            if url_hash:
-                existing = bot.db.query_one(
-                    "SELECT post_id FROM aoe4_news WHERE url_hash = ?", 
-                    (url_hash,)
-                )
-            
-            if not existing:
-                success = await post_aoe4_news(bot, latest_announcement)
-                if success:
-                    logger.info(f"Posted latest AOE4 announcement on startup: {latest_announcement['title']}")
+        await bot.guild_configs.adopt_legacy_guild(bot)
     except Exception as e:
-        logger.error(f"Error checking for latest AOE4 news on startup: {e}", exc_info=True)
+        logger.error(f"Error adopting legacy guild configuration: {e}")
+
+    # Start background tasks in the background, a few seconds apart, most visible first.
+    # The news loop's first iteration is the startup news check
+    if BOT_MODE == "bot":
+        # poller.py fetches profiles, games and news; this process only applies and posts them
+        loops = [update_active_players_status, update_all_players, reconcile_guild_roles,
+                 cleanup_deleted_news, post_queued_news]
+    else:
+        loops = [update_active_players_status, update_all_players, refresh_player_profiles,
+                 cleanup_deleted_news, check_aoe4_news]
+    if SNAPSHOT_ENABLED:
+        loops.append(snapshot_state)
+    bot.loop_starter = asyncio.create_task(start_loops(bot, loops))
+
+    time_to_ready = time.perf_counter() - bot.started_at
+    TIME_TO_READY.set(time_to_ready)
+    logger.info(f"Ready in {time_to_ready:.1f}s (setup {bot.setup_seconds:.1f}s)")
 
 def main():
+    if BOT_MODE not in ("all", "bot"):
+        logger.error(f"Unknown BOT_MODE {BOT_MODE!r}: use 'all', or 'bot' together with poller.py")
+        return
+
     bot = AOE4RankBot()
     
     # Register event handlers
     @bot.event
     async def on_ready():
-        await on_ready(bot)
+        await handle_ready(bot)
     
     @bot.event
     async def on_message_delete(message):
-        await on_message_delete(bot, message)
+        await handle_message_delete(bot, message)
     
     # Register commands
     register_commands(bot)
@@ -0,0 +1,311 @@
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+from config import *
+
+logger = logging.getLogger('AOE4RankBot')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOOP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class Counter:
+    """Monotonic counter, one series per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self):
+        for key, value in self.values.items():
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+class Gauge:
+    """Value that can go up and down, or be read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[LabelKey, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the (unlabelled) value from function whenever it is rendered"""
+        self._function = function
+
+    def get(self, **labels) -> Optional[float]:
+        if self._function and not labels:
+            return self._function()
+        return self.values.get(_label_key(labels))
+
+    def render(self):
+        if self._function:
+            try:
+                yield f"{self.name} {_format_value(self._function())}"
+            except Exception as e:
+                logger.error(f"Error reading gauge {self.name}: {e}")
+            return
+        for key, value in self.values.items():
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+class Histogram:
+    """Bucketed observations (cumulative buckets, sum and count per label set)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (last is +Inf), sum, count]
+        self.series: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """Count, mean and approximate p95 for every series matching the given labels"""
+        wanted = set(_label_key(labels))
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        count = 0
+        for key, (bucket_counts, series_sum, series_count) in self.series.items():
+            if wanted <= set(key):
+                counts = [a + b for a, b in zip(counts, bucket_counts)]
+                total += series_sum
+                count += series_count
+        return {
+            'count': count,
+            'mean': total / count if count else 0.0,
+            'p95': self._quantile(counts, count, 0.95)
+        }
+
+    def _quantile(self, counts, count, q) -> float:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not count:
+            return 0.0
+        target = q * count
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            if running >= target:
+                return bound
+        return float('inf')
+
+    def counts_by(self, label: str, **labels) -> Dict[str, int]:
+        """Observation counts per value of one label, for series matching the given labels"""
+        wanted = set(_label_key(labels))
+        counts: Dict[str, int] = {}
+        for key, (_, _, series_count) in self.series.items():
+            value = dict(key).get(label)
+            if value is not None and wanted <= set(key):
+                counts[value] = counts.get(value, 0) + series_count
+        return counts
+
+    def label_values(self, label: str):
+        """Distinct values seen for one label, in first-seen order"""
+        values = []
+        for key in self.series:
+            value = dict(key).get(label)
+            if value is not None and value not in values:
+                values.append(value)
+        return values
+
+    def render(self):
+        for key, (bucket_counts, series_sum, series_count) in self.series.items():
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                running += bucket_count
+                yield f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {running}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(series_sum)}"
+            yield f"{self.name}_count{_format_labels(key)} {series_count}"
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+LOOP_DURATION = metrics.histogram(
+    'aoe4bot_loop_duration_seconds', 'Duration of each background loop iteration', buckets=LOOP_BUCKETS)
+LOOP_LAST_DURATION = metrics.gauge(
+    'aoe4bot_loop_last_duration_seconds', 'Duration of the most recent iteration of each loop')
+LOOP_OVERRUNS = metrics.counter(
+    'aoe4bot_loop_overruns_total', 'Loop iterations that took longer than the loop interval')
+LOOP_ERRORS = metrics.counter(
+    'aoe4bot_loop_errors_total', 'Loop iterations that raised an exception')
+HTTP_REQUEST_DURATION = metrics.histogram(
+    'aoe4bot_http_request_duration_seconds', 'Outbound HTTP request latency by host and status')
+API_THROTTLED_RESPONSES = metrics.counter(
+    'aoe4bot_api_throttled_responses_total', 'aoe4world 429/503 responses that paused the scheduler')
+DB_OPERATION_DURATION = metrics.histogram(
+    'aoe4bot_db_operation_duration_seconds', 'Database operation time including queueing, by operation')
+DISCORD_REQUESTS = metrics.counter(
+    'aoe4bot_discord_requests_total', 'Discord REST calls by method, route and outcome')
+EVENT_LOOP_LAG = metrics.gauge(
+    'aoe4bot_event_loop_lag_seconds', 'How late the most recent event loop lag probe woke up')
+EVENT_LOOP_LAG_HISTOGRAM = metrics.histogram(
+    'aoe4bot_event_loop_lag_probe_seconds', 'Event loop lag probe results')
+REGISTERED_PLAYERS = metrics.gauge(
+    'aoe4bot_registered_players', 'Registered accounts (mains and smurfs)')
+TIME_TO_READY = metrics.gauge(
+    'aoe4bot_time_to_ready_seconds', 'Seconds from process start to the first ready event')
+
+def timed_loop(name: str, interval_seconds: float):
+    """Record duration, overruns and errors of a tasks.loop coroutine.
+
+    Apply below @tasks.loop so every iteration is measured."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                LOOP_ERRORS.inc(loop=name)
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                LOOP_DURATION.observe(duration, loop=name)
+                LOOP_LAST_DURATION.set(duration, loop=name)
+                if duration > interval_seconds:
+                    LOOP_OVERRUNS.inc(loop=name)
+                    logger.warning(f"Loop {name} took {duration:.1f}s, longer than its {interval_seconds}s interval")
+        return wrapper
+    return decorator
+
+def instrument_discord_http(http):
+    """Count every Discord REST call made through the client's HTTPClient"""
+    original_request = http.request
+
+    async def request(route, **kwargs):
+        outcome = "ok"
+        try:
+            return await original_request(route, **kwargs)
+        except Exception as e:
+            outcome = str(getattr(e, 'status', type(e).__name__))
+            raise
+        finally:
+            DISCORD_REQUESTS.inc(method=route.method, route=route.path, outcome=outcome)
+
+    http.request = request
+
+async def monitor_event_loop_lag(interval: float = METRICS_LAG_INTERVAL):
+    """Sleep for interval repeatedly and record how late each wake-up is"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+def register_bot_gauges(bot):
+    """Gauges read from the bot's caches and queues at scrape time"""
+    metrics.gauge('aoe4bot_profile_cache_size', 'Profiles held in the profile cache').set_function(
+        lambda: bot.profile_cache.stats()['size'])
+    metrics.gauge('aoe4bot_profile_cache_hit_ratio', 'Profile cache hit rate since startup').set_function(
+        lambda: bot.profile_cache.stats()['hit_rate'])
+    metrics.gauge('aoe4bot_api_queue_length', 'aoe4world requests waiting for a rate limit token').set_function(
+        lambda: sum(bot.api_scheduler.pending().values()))
+    metrics.gauge('aoe4bot_write_buffer_pending', 'Writes waiting in the write-behind buffer').set_function(
+        lambda: len(bot.write_buffer))
+
+class MetricsServer:
+    """Serves /metrics in the Prometheus text format on a local port"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(
+            body=metrics.render().encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,244 +1,150 @@
 import discord
-import aiohttp
+import asyncio
 import logging
-import re
+from collections import OrderedDict
+from datetime import datetime, timezone
 from config import *
-from bs4 import BeautifulSoup
+from extraction import extract_article
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
 import hashlib
 
 logger = logging.getLogger('AOE4RankBot')
 
+# Returned by fetch_full_article when a conditional request comes back 304
+NOT_MODIFIED = object()
+
+# Parsed results kept so a 304 can be answered without re-parsing
+_listing_cache = {}              # listing url -> article urls
+_article_cache = OrderedDict()   # article url -> article data
+
+def export_news_cache(http_session):
+    """Parsed listings and articles with the validators that let a 304 reuse them"""
+    urls = list(_listing_cache) + list(_article_cache)
+    return {
+        'listings': dict(_listing_cache),
+        'articles': list(_article_cache.items()),
+        'validators': {url: http_session.validators[url] for url in urls if url in http_session.validators}
+    }
+
+def restore_news_cache(http_session, cache):
+    """Restore exported news caches; a validator is only kept with the content it validates"""
+    _listing_cache.update(cache.get('listings', {}))
+    for url, article in cache.get('articles', [])[-NEWS_ARTICLE_CACHE_SIZE:]:
+        _article_cache[url] = article
+    for url, validator in cache.get('validators', {}).items():
+        if url in _listing_cache or url in _article_cache:
+            http_session.validators.setdefault(url, validator)
+
+# Article pages are parsed with only the subtrees the extractor reads:
+# <head> for <title>/<meta>, the article/main containers, and headers, navs
+# (breadcrumbs), headings and <time> elements that can sit outside them, plus
+# any element carrying one of the classes the selector chains look for
+ARTICLE_TAGS = {'head', 'article', 'main', 'header', 'nav', 'h1', 'time'}
+ARTICLE_CLASSES = {
+    'article-title', 'entry-title', 'article-date', 'post-date', 'author', 'byline', 'post-author',
+    'article-content', 'entry-content', 'post-content', 'article-image', 'featured-image',
+    'post-thumbnail', 'category', 'article-category', 'post-category', 'breadcrumbs', 'breadcrumb'
+}
+
+def keep_article_element(name, attrs):
+    """Whether a top-level element is kept when parsing an article page"""
+    if name in ARTICLE_TAGS:
+        return True
+    classes = (attrs or {}).get('class') or ()
+    if isinstance(classes, str):
+        classes = classes.split()
+    return not ARTICLE_CLASSES.isdisjoint(classes)
+
+class ArticleStrainer(SoupStrainer):
+    """SoupStrainer that matches on tag name or class, which a plain strainer cannot combine"""
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        # beautifulsoup4 >= 4.13
+        return keep_article_element(name, attrs)
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # beautifulsoup4 < 4.13
+        return markup_name if keep_article_element(markup_name, markup_attrs) else None
+
+ARTICLE_STRAINER = ArticleStrainer()
+
+_parser_executor: Optional[Executor] = None
+
+def get_parser_executor() -> Executor:
+    """Worker pool for HTML parsing, created on first use"""
+    global _parser_executor
+    if _parser_executor is None:
+        if NEWS_PARSER_MODE == "process":
+            _parser_executor = ProcessPoolExecutor(max_workers=NEWS_PARSER_WORKERS)
+        else:
+            _parser_executor = ThreadPoolExecutor(max_workers=NEWS_PARSER_WORKERS, thread_name_prefix='news-parser')
+        logger.info(f"Started news parser pool ({NEWS_PARSER_MODE}, {NEWS_PARSER_WORKERS} workers)")
+    return _parser_executor
+
+async def run_parser(func, *args):
+    """Run a parsing function in the parser pool so it never blocks the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parser_executor(), func, *args)
+
+def shutdown_parser():
+    """Stop the parser pool"""
+    global _parser_executor
+    if _parser_executor is not None:
+        _parser_executor.shutdown(wait=False)
+        _parser_executor = None
+
 # News fetching functions
-async def fetch_full_article(url, headers=None):
-    """Fetch the complete article HTML content"""
+async def fetch_full_article(bot, url, headers=None, conditional=False):
+    """Fetch the complete article HTML content.
+
+    With conditional, returns NOT_MODIFIED if the page is unchanged since the last fetch."""
     if not headers:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         }
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.text()
-                logger.warning(f"Failed to fetch article at {url}: HTTP {response.status}")
-                return None
-        except Exception as e:
-            logger.error(f"Error fetching article at {url}: {e}")
-            return None
-
-def extract_article_title(soup):
-    """Extract the actual article title from the HTML"""
-    # Look for the most specific title elements first
-    title_elem = (
-        soup.select_one('article h1') or
-        soup.select_one('main h1') or
-        soup.select_one('.article-title') or
-        soup.select_one('.entry-title') or
-        soup.select_one('h1')
-    )
-    
-    if title_elem:
-        title = title_elem.get_text(strip=True)
-        # Remove any unnecessary prefixes
-        title = re.sub(r'^(Age of Empires IV:?\s*)', '', title)
-        return title
-    
-    # Fallback to page title
-    if soup.title:
-        title = soup.title.get_text(strip=True)
-        # Clean up page title
-        title = re.sub(r'\s*\|\s*Age of Empires.*$', '', title)
-        title = re.sub(r'^(Age of Empires IV:?\s*)', '', title)
-        return title
-        
-    return None
-
-def extract_article_date(soup):
-    """Extract the publication date from the article"""
-    # Try various date elements
-    date_elem = (
-        soup.select_one('meta[property="article:published_time"]') or
-        soup.select_one('.article-date') or
-        soup.select_one('.post-date') or
-        soup.select_one('time')
-    )
-    
-    if date_elem:
-        if date_elem.name == 'meta':
-            date_str = date_elem.get('content')
-            if date_str:
-                try:
-                    date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                    return date_obj.strftime("%B %d, %Y")
-                except:
-                    pass
-        else:
-            return date_elem.get_text(strip=True)
-    
-    # Try to find date in the text
-    date_patterns = [
-        r'(\w+ \d{1,2}, 20\d{2})',  # March 10, 2025
-        r'(\d{1,2} \w+ 20\d{2})',    # 10 March 2025
-        r'(\d{2}/\d{2}/20\d{2})'     # 03/10/2025
-    ]
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, soup.get_text())
-        if match:
-            return match.group(1)
-    
-    return "Unknown date"
-
-def extract_article_author(soup):
-    """Extract the author from the article"""
-    author_elem = (
-        soup.select_one('.author') or
-        soup.select_one('.byline') or
-        soup.select_one('.post-author') or
-        soup.select_one('meta[name="author"]')
-    )
-    
-    if author_elem:
-        if author_elem.name == 'meta':
-            return author_elem.get('content')
-        else:
-            author_text = author_elem.get_text(strip=True)
-            # Clean up "by Author Name" format
-            author_text = re.sub(r'^by\s+', '', author_text, flags=re.IGNORECASE)
-            return author_text
-    
-    return None
-
-def extract_article_content(soup):
-    """Extract the main content from the article"""
-    # Try to find the main content container
-    content_elem = (
-        soup.select_one('article .content') or
-        soup.select_one('.article-content') or
-        soup.select_one('.entry-content') or
-        soup.select_one('.post-content') or
-        soup.select_one('main')
-    )
-    
-    if not content_elem:
-        content_elem = soup
-    
-    # Extract paragraphs
-    paragraphs = content_elem.select('p')
-    
-    # Filter out navigation, comments, etc.
-    filtered_paragraphs = []
-    for p in paragraphs:
-        # Skip paragraphs in navigation, sidebar, footer, etc.
-        if any(p.parent.name == x or p.parent.get('class') and any(c in ' '.join(p.parent.get('class')) for c in x) 
-               for x in ['nav', 'menu', 'sidebar', 'footer', 'comment']):
-            continue
-        
-        # Skip empty paragraphs
-        if not p.get_text(strip=True):
-            continue
-            
-        # Skip very short paragraphs that might be buttons or navigation
-        if len(p.get_text(strip=True)) < 10 and not any(c.name == 'a' for c in p.children):
-            continue
-            
-        filtered_paragraphs.append(p.get_text(strip=True))
-    
-    # Create full content and preview
-    if filtered_paragraphs:
-        full_content = '\n\n'.join(filtered_paragraphs)
-        
-        # Create preview (first few paragraphs)
-        preview_paragraphs = []
-        preview_length = 0
-        for p in filtered_paragraphs:
-            preview_paragraphs.append(p)
-            preview_length += len(p)
-            if preview_length > 800:
-                break
-                
-        preview = '\n\n'.join(preview_paragraphs)
-        if len(preview) < len(full_content):
-            preview += '\n\n... [Read more on the website]'
-            
-        return full_content, preview
-    
-    return None, None
-
-def extract_article_image(soup):
-    """Extract the main image from the article"""
-    # Try to find header/featured image
-    image_elem = (
-        soup.select_one('.article-image img') or
-        soup.select_one('.featured-image img') or
-        soup.select_one('article img') or
-        soup.select_one('.post-thumbnail img') or
-        soup.select_one('main img')
-    )
-    
-    if image_elem and image_elem.get('src'):
-        src = image_elem['src']
-        if not src.startswith('http'):
-            src = f"https://www.ageofempires.com{src}"
-        return src
-    
-    return None
-
-def extract_article_category(soup):
-    """Extract the article category"""
-    category_elem = (
-        soup.select_one('.category') or
-        soup.select_one('.article-category') or
-        soup.select_one('.post-category')
-    )
-    
-    if category_elem:
-        return category_elem.get_text(strip=True)
-    
-    # Look for category in breadcrumbs
-    breadcrumbs = soup.select('.breadcrumbs a, .breadcrumb a')
-    for crumb in breadcrumbs:
-        if 'category' in crumb.get('href', ''):
-            return crumb.get_text(strip=True)
-    
-    return "Uncategorized"
-
-async def get_article_details(url, news_type):
-    """Fetch and extract full article details"""
-    html = await fetch_full_article(url)
-    if not html:
+    try:
+        status, html = await bot.http_session.get_text(url, headers=headers, conditional=conditional)
+        if status == 200:
+            return html
+        if status == 304:
+            return NOT_MODIFIED
+        logger.warning(f"Failed to fetch article at {url}: HTTP {status}")
         return None
-        
-    soup = BeautifulSoup(html, 'html.parser')
-    
-    # Extract the important article data
-    title = extract_article_title(soup)
-    date = extract_article_date(soup)
-    author = extract_article_author(soup)
-    full_content, preview = extract_article_content(soup)
-    image_url = extract_article_image(soup)
-    category = extract_article_category(soup)
+    except Exception as e:
+        logger.error(f"Error fetching article at {url}: {e}")
+        return None
+
+# Selector-chain extractors, one per field. parse_article_html uses the
+# single-pass extract_article instead; these are kept as the reference the
+# benchmarks compare against.
+def parse_article_html(html, url, news_type):
+    """Parse an article page into article data. Runs in the parser pool"""
+    soup = BeautifulSoup(html, 'lxml', parse_only=ARTICLE_STRAINER)
+    
+    fields = extract_article(soup, url)
+    if not fields['content']:
+        # None of the known containers held the text; read the whole page
+        fields = extract_article(BeautifulSoup(html, 'lxml'), url)
     
     # Generate a unique post ID
-    post_id = url.split('/')[-1].split('?')[0]
-    if not post_id or post_id == '':
-        # Hash the URL for a consistent ID
-        post_id = hashlib.md5(url.encode()).hexdigest()
+    post_id = post_id_for(url)
     
     # Generate URL hash for deduplication
-    url_hash = hashlib.md5(url.encode()).hexdigest()
+    url_hash = url_hash_for(url)
     
     article_data = {
         'post_id': post_id,
-        'title': title or "Age of Empires IV News",
+        'title': fields['title'] or "Age of Empires IV News",
         'url': url,
-        'date': date,
-        'author': author,
-        'content': full_content,
-        'preview': preview,
-        'image_url': image_url,
-        'category': category,
+        'date': fields['date'],
+        'author': fields['author'],
+        'content': fields['content'],
+        'preview': fields['preview'],
+        'image_url': fields['image_url'],
+        'category': fields['category'],
         'content_type': news_type,
         'is_patch': news_type == "patch",
         'url_hash': url_hash
@@ -246,7 +152,75 @@ async def get_article_details(url, news_type):
     
     return article_data
 
-async def get_news_listing(news_type="announcement"):
+async def get_article_details(bot, url, news_type):
+    """Fetch and extract full article details"""
+    cached = _article_cache.get(url)
+    html = await fetch_full_article(bot, url, conditional=cached is not None)
+    if html is NOT_MODIFIED:
+        # Unchanged since we last parsed it
+        _article_cache.move_to_end(url)
+        return dict(cached, content_type=news_type, is_patch=news_type == "patch")
+    if not html:
+        return None
+        
+    try:
+        article_data = await run_parser(parse_article_html, html, url, news_type)
+    except Exception as e:
+        logger.error(f"Error parsing article at {url}: {e}")
+        return None
+
+    _article_cache[url] = article_data
+    _article_cache.move_to_end(url)
+    while len(_article_cache) > NEWS_ARTICLE_CACHE_SIZE:
+        _article_cache.popitem(last=False)
+    
+    return dict(article_data)
+
+def parse_news_listing_html(html):
+    """Extract AOE4 article links from a news listing page. Runs in the parser pool"""
+    soup = BeautifulSoup(html, 'lxml')
+    
+    # Find all article cards/links
+    articles = []
+    
+    # Try different selectors for the article cards
+    article_elements = (
+        soup.select('.article-card, .news-item, article') or
+        soup.select('.post, .news-post') or
+        soup.select('a[href*="/news/"]')
+    )
+    
+    for article in article_elements:
+        # Get the link element
+        if article.name == 'a':
+            link = article
+        else:
+            link = article.select_one('a[href*="/news/"]')
+            
+        if not link or not link.get('href'):
+            continue
+            
+        # Get the URL
+        article_url = link['href']
+        if not article_url.startswith('http'):
+            article_url = f"https://www.ageofempires.com{article_url}"
+            
+        # Skip if not AOE4 related
+        if 'aoeiv' not in article_url and not any(x in article_url.lower() for x in ['age-of-empires-iv', 'age-iv']):
+            # Check the text for AOE4 mentions
+            if not any(x in article.get_text().lower() for x in ['age of empires iv', 'age iv', 'aoe4', 'aoeiv']):
+                continue
+        
+        # Add to the list of articles to process
+        articles.append(article_url)
+        
+        # Limit to first 5 articles to avoid too many requests
+        if len(articles) >= 5:
+            break
+            
+    return articles
+
+async def get_news_listing(bot, news_type="announcement"):
     """Fetch the news listing page and extract article links"""
     url = PATCH_NOTES_URL if news_type == "patch" else ANNOUNCEMENT_NEWS_URL
     
@@ -260,68 +234,90 @@ async def get_news_listing(news_type="announcement"):
     }
     
     try:
-        html = await fetch_full_article(url, headers)
+        cached = _listing_cache.get(url)
+        html = await fetch_full_article(bot, url, headers, conditional=cached is not None)
+        if html is NOT_MODIFIED:
+            logger.info(f"News listing unchanged: {url}")
+            return list(cached)
         if not html:
             return []
             
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Find all article cards/links
-        articles = []
-        
-        # Try different selectors for the article cards
-        article_elements = (
-            soup.select('.article-card, .news-item, article') or
-            soup.select('.post, .news-post') or
-            soup.select('a[href*="/news/"]')
-        )
-        
-        for article in article_elements:
-            # Get the link element
-            if article.name == 'a':
-                link = article
-            else:
-                link = article.select_one('a[href*="/news/"]')
-                
-            if not link or not link.get('href'):
-                continue
-                
-            # Get the URL
-            article_url = link['href']
-            if not article_url.startswith('http'):
-                article_url = f"https://www.ageofempires.com{article_url}"
-                
-            # Skip if not AOE4 related
-            if 'aoeiv' not in article_url and not any(x in article_url.lower() for x in ['age-of-empires-iv', 'age-iv']):
-                # Check the text for AOE4 mentions
-                if not any(x in article.get_text().lower() for x in ['age of empires iv', 'age iv', 'aoe4', 'aoeiv']):
-                    continue
-            
-            # Add to the list of articles to process
-            articles.append(article_url)
-            
-            # Limit to first 5 articles to avoid too many requests
-            if len(articles) >= 5:
-                break
-                
-        return articles
+        articles = await run_parser(parse_news_listing_html, html)
+
+        _listing_cache[url] = articles
+        return list(articles)
         
     except Exception as e:
         logger.error(f"Error fetching news listing: {e}")
         return []
 
-async def fetch_aoe4_news(news_type="announcement"):
-    """Fetch and process AOE4 news articles"""
+def url_hash_for(url):
+    """Hash used to deduplicate posted articles by URL"""
+    return hashlib.md5(url.encode()).hexdigest()
+
+def post_id_for(url):
+    """Post id of an article: the last path segment, or the URL hash if there is none"""
+    post_id = url.split('/')[-1].split('?')[0]
+    if not post_id:
+        # Hash the URL for a consistent ID
+        post_id = url_hash_for(url)
+    return post_id
+
+async def find_posted_news(bot, urls):
+    """Map article URLs to the (post_id, message_id) of their aoe4_news row.
+
+    A URL matches a row by post id or by URL hash. URLs without a row are left out."""
+    if not urls:
+        return {}
+    keys = {url: (post_id_for(url), url_hash_for(url)) for url in urls}
+    post_ids = {post_id for post_id, _ in keys.values()}
+    hashes = {url_hash for _, url_hash in keys.values()}
+    rows = await bot.db.query(
+        f"SELECT post_id, url_hash, message_id FROM aoe4_news "
+        f"WHERE post_id IN ({','.join('?' for _ in post_ids)}) OR url_hash IN ({','.join('?' for _ in hashes)})",
+        tuple(post_ids) + tuple(hashes)
+    )
+    by_post_id = {post_id: (post_id, message_id) for post_id, _, message_id in rows}
+    by_hash = {url_hash: (post_id, message_id) for post_id, url_hash, message_id in rows}
+
+    posted = {}
+    for url, (post_id, url_hash) in keys.items():
+        row = by_post_id.get(post_id) or by_hash.get(url_hash)
+        if row:
+            posted[url] = row
+    return posted
+
+async def filter_unposted_urls(bot, urls):
+    """Drop article URLs that have already been posted, keeping listing order.
+
+    Uses the same lookup as post_aoe4_news. Rows of deleted messages are removed
+    by the message delete handler and cleanup_deleted_news, after which the
+    article is eligible again."""
+    posted = await find_posted_news(bot, urls)
+    return [url for url in urls if url not in posted]
+
+async def fetch_aoe4_news(bot, news_type="announcement", limit=None, skip_known=True):
+    """Fetch and process AOE4 news articles.
+
+    Only the first `limit` listing entries are considered, and with skip_known
+    articles that were already posted are not downloaded at all."""
     try:
         # Get the list of article URLs
-        article_urls = await get_news_listing(news_type)
+        article_urls = await get_news_listing(bot, news_type)
+        if limit:
+            article_urls = article_urls[:limit]
+        if skip_known:
+            article_urls = await filter_unposted_urls(bot, article_urls)
         
-        # Process each article
-        articles = []
-        for url in article_urls:
-            article_data = await get_article_details(url, news_type)
-            if article_data:
-                articles.append(article_data)
+        # Fetch the remaining articles concurrently
+        semaphore = asyncio.Semaphore(NEWS_FETCH_CONCURRENCY)
+
+        async def fetch_article(url):
+            async with semaphore:
+                return await get_article_details(bot, url, news_type)
+
+        results = await asyncio.gather(*(fetch_article(url) for url in article_urls))
+        articles = [article_data for article_data in results if article_data]
                 
         # Sort by date (newest first)
         articles.sort(key=lambda x: x['date'], reverse=True)
@@ -400,37 +396,31 @@ async def post_aoe4_news(bot, article):
         return False
     
     try:
-        # Verify the table exists with correct schema
-        bot.db.update_news_table_schema()
-        
-        # Check if we've already posted this specific URL
-        url_hash = article.get('url_hash')
-        if not url_hash:
-            url_hash = hashlib.md5(article['url'].encode()).hexdigest()
-            
-        # Check both by post_id and url_hash
-        existing = bot.db.query_one(
-            "SELECT post_id, message_id FROM aoe4_news WHERE post_id = ? OR url_hash = ?", 
-            (article['post_id'], url_hash)
-        )
+        # Check if we've already posted this URL, by post_id and url_hash
+        url_hash = url_hash_for(article['url'])
+        existing = (await find_posted_news(bot, [article['url']])).get(article['url'])
         
         if existing:
             post_id, message_id = existing
-            
-            # If message_id exists, check if the message still exists
-            if message_id:
-                try:
-                    await channel.fetch_message(int(message_id))
-                    # Message still exists, don't repost
-                    logger.info(f"News already posted and message still exists: {article['title']}")
-                    return False
-                except discord.NotFound:
-                    # Message was deleted, remove from database so we can repost
-                    logger.info(f"News message was deleted, will repost: {article['title']}")
-                    bot.db.execute("DELETE FROM aoe4_news WHERE post_id = ?", (post_id,))
-                    bot.db.commit()
-                except Exception as e:
-                    logger.error(f"Error checking message {message_id}: {e}")
+            if not message_id:
+                # Posted before message ids were stored, so it cannot be checked
+                logger.info(f"News already posted: {article['title']}")
+                return False
+
+            # Check if the message still exists
+            try:
+                await channel.fetch_message(int(message_id))
+                # Message still exists, don't repost
+                logger.info(f"News already posted and message still exists: {article['title']}")
+                return False
+            except discord.NotFound:
+                # Message was deleted, remove from database so we can repost
+                logger.info(f"News message was deleted, will repost: {article['title']}")
+                await bot.db.execute("DELETE FROM aoe4_news WHERE post_id = ?", (post_id,))
+            except Exception as e:
+                # Reposting could duplicate a message that still exists
+                logger.error(f"Error checking message {message_id}, not reposting: {e}")
+                return False
         
         # Create and send embed
         embed = create_news_embed(article)
@@ -450,7 +440,7 @@ async def post_aoe4_news(bot, article):
         
         # Save to database with message_id and url_hash
         try:
-            bot.db.execute(
+            await bot.db.execute(
                 """INSERT INTO aoe4_news 
                 (post_id, title, url, date, category, content_type, is_patch, message_id, url_hash) 
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
@@ -466,7 +456,6 @@ async def post_aoe4_news(bot, article):
                     url_hash
                 )
             )
-            bot.db.commit()
         except Exception as e:
             logger.error(f"Database error saving news: {e}", exc_info=True)
         
@@ -0,0 +1,105 @@
+"""Poller process for the split deployment.
+
+Fetches profiles, live games and news and stores the results in players.db,
+where main.py running with BOT_MODE=bot picks them up. It never connects to
+Discord, so slow requests or parsing here cannot delay the gateway.
+
+Run it next to the bot from the same directory:
+    BOT_MODE=bot python main.py
+    python poller.py
+"""
+import asyncio
+import logging
+import signal
+
+from config import *
+from database import AOE4Database, WriteBehindBuffer
+from http_client import HTTPSession
+from cache import ProfileCache
+from game_tracker import GameTracker
+from snapshot import save_snapshot, restore_snapshot
+from scheduler import RequestScheduler
+from news import shutdown_parser
+from metrics import MetricsServer, register_bot_gauges, monitor_event_loop_lag
+from tasks import (
+    poll_player_profiles, poll_live_games, queue_aoe4_news, snapshot_state, load_player_activity, start_loops
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+logger = logging.getLogger('AOE4RankBot')
+
+POLLER_LOOPS = (poll_player_profiles, poll_live_games, queue_aoe4_news) + ((snapshot_state,) if SNAPSHOT_ENABLED else ())
+
+class AOE4Poller:
+    """Carries the attributes the polling tasks read from AOE4RankBot"""
+
+    def __init__(self):
+        self.db = AOE4Database()
+        self.write_buffer = WriteBehindBuffer(self.db)
+        self.http_session = HTTPSession()
+        self.api_scheduler = RequestScheduler(self.http_session)
+        self.profile_cache = ProfileCache()
+        self.game_tracker = GameTracker(self.db)
+        self.metrics_server = MetricsServer(port=POLLER_METRICS_PORT)
+        self.snapshot_path = POLLER_SNAPSHOT_PATH
+        self.started = False
+        self.lag_monitor = None
+        self.loop_starter = None
+
+    async def start(self):
+        register_bot_gauges(self)
+        self.lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+        if METRICS_ENABLED:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Could not start metrics endpoint: {e}")
+        await asyncio.gather(load_player_activity(self), self.game_tracker.load(), self.http_session.start())
+        if SNAPSHOT_ENABLED:
+            await restore_snapshot(self)
+        self.started = True
+        self.loop_starter = asyncio.create_task(start_loops(self, POLLER_LOOPS))
+        logger.info("Poller started")
+
+    async def close(self):
+        for loop in POLLER_LOOPS:
+            loop.cancel()
+        for task in (self.lag_monitor, self.loop_starter):
+            if task:
+                task.cancel()
+        await self.metrics_server.stop()
+        if SNAPSHOT_ENABLED and self.started:
+            try:
+                await save_snapshot(self)
+            except Exception as e:
+                logger.error(f"Error saving state snapshot: {e}")
+        await self.api_scheduler.close()
+        await self.http_session.close()
+        shutdown_parser()
+        await self.write_buffer.close()
+        await self.db.close()
+
+async def run():
+    poller = AOE4Poller()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: KeyboardInterrupt ends asyncio.run instead
+
+    await poller.start()
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Stopping poller")
+        await poller.close()
+
+def main():
+    if BOT_MODE == "all":
+        logger.warning("BOT_MODE is 'all': main.py also polls, run it with BOT_MODE=bot alongside the poller")
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
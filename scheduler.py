@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from config import *
+from metrics import API_THROTTLED_RESPONSES
+
+logger = logging.getLogger('AOE4RankBot')
+
+# Request priority classes (lower runs first)
+PRIORITY_INTERACTIVE = 0  # Slash commands waiting on a reply
+PRIORITY_LIVE = 1         # Live game tracker
+PRIORITY_BACKGROUND = 2   # Leaderboard and other background refreshes
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_LIVE: "live",
+    PRIORITY_BACKGROUND: "background"
+}
+
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    """Rate-limit-aware scheduler for aoe4world.com requests.
+
+    Requests wait for a token from a shared token bucket and are released in
+    priority order. A 429/503 pauses the whole bucket for Retry-After, and
+    failed requests are retried with exponential backoff and jitter."""
+
+    def __init__(self, http_session, rate: float = AOE4WORLD_RATE_LIMIT, burst: int = AOE4WORLD_RATE_BURST,
+                 max_retries: int = AOE4WORLD_MAX_RETRIES):
+        self.http_session = http_session
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self.request_counts: Dict[int, int] = {priority: 0 for priority in PRIORITY_NAMES}
+        self.throttled_count = 0
+
+    def pending(self) -> Dict[str, int]:
+        """Number of requests waiting for a token, per priority class"""
+        counts = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                counts[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return counts
+
+    def pause(self, delay: float):
+        """Hold every queued request for at least delay seconds"""
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    async def acquire(self, priority: int = PRIORITY_BACKGROUND):
+        """Wait until the bucket grants this request a token"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        while self._waiters:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # Caller gave up while waiting
+            self._tokens -= 1
+            future.set_result(None)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(AOE4WORLD_BACKOFF_BASE * (2 ** attempt), AOE4WORLD_BACKOFF_MAX)
+        return delay + random.uniform(0, delay / 2)
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                       priority: int = PRIORITY_BACKGROUND) -> Tuple[int, Any]:
+        """GET a JSON resource through the scheduler. Returns (status, data)"""
+        status = 0
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(priority)
+            self.request_counts[priority] = self.request_counts.get(priority, 0) + 1
+            try:
+                status, data, headers = await self.http_session.get_json(url, params=params)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Request to {url} failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            if status not in RETRYABLE_STATUSES:
+                return status, data
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+
+            if status in (429, 503):
+                # Throttling applies to the whole API, so hold every queued request,
+                # even when this caller has no retries left
+                self.throttled_count += 1
+                API_THROTTLED_RESPONSES.inc()
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                self.pause(delay)
+                logger.warning(f"aoe4world throttled request (HTTP {status}), pausing requests for {delay:.1f}s")
+                if attempt >= self.max_retries:
+                    break
+            else:
+                if attempt >= self.max_retries:
+                    break
+                delay = self._backoff(attempt)
+                logger.warning(f"Request to {url} returned HTTP {status}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        return status, None
+
+    async def close(self):
+        """Stop dispatching and release any queued callers"""
+        if self._pump_task and not self._pump_task.done():
+            self._pump_task.cancel()
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
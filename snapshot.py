@@ -0,0 +1,85 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from config import *
+
+logger = logging.getLogger('AOE4RankBot')
+
+SNAPSHOT_VERSION = 1
+
+def collect_snapshot(bot) -> Dict[str, Any]:
+    """Gather the warm-restart state. The result shares objects with the live caches"""
+    from tasks import export_player_activity
+    from news import export_news_cache
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': time.time(),
+        'activity': export_player_activity(),
+        'profiles': bot.profile_cache.export(),
+        'news': export_news_cache(bot.http_session)
+    }
+
+def write_snapshot_file(path: str, data: bytes):
+    """Write serialized snapshot JSON gzipped, replacing the old file atomically"""
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def read_snapshot_file(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+async def save_snapshot(bot):
+    """Serialize the caches on the event loop, then compress and write them off it.
+
+    The snapshot references live cache objects, so it is turned into JSON before
+    any other task can change them; only the bytes go to the thread."""
+    start = time.perf_counter()
+    snapshot = collect_snapshot(bot)
+    data = json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+    await asyncio.to_thread(write_snapshot_file, bot.snapshot_path, data)
+    logger.info(
+        f"Saved state snapshot ({len(snapshot['profiles'])} profiles, "
+        f"{len(snapshot['activity'])} activity entries) in {time.perf_counter() - start:.2f}s"
+    )
+
+async def restore_snapshot(bot) -> bool:
+    """Reload a snapshot written by a previous run, unless it is missing, unreadable or too old.
+
+    Profiles past the cache's stale TTL are skipped; everything else is
+    merged with state already loaded from the database."""
+    from tasks import restore_player_activity
+    from news import restore_news_cache
+
+    try:
+        snapshot = await asyncio.to_thread(read_snapshot_file, bot.snapshot_path)
+    except Exception as e:
+        logger.error(f"Error reading state snapshot {bot.snapshot_path}: {e}")
+        return False
+    if not snapshot:
+        return False
+
+    age = time.time() - snapshot.get('saved_at', 0)
+    if snapshot.get('version') != SNAPSHOT_VERSION or age > SNAPSHOT_MAX_AGE_MINUTES * 60:
+        logger.info(f"Ignoring state snapshot (version {snapshot.get('version')}, {age / 60:.0f} minutes old)")
+        return False
+
+    # Ages were measured when the snapshot was saved; add the downtime since
+    profiles = [(key, entry_age + age, data) for key, entry_age, data in snapshot.get('profiles', [])]
+    restored_profiles = bot.profile_cache.restore(profiles)
+    restore_player_activity(snapshot.get('activity', {}))
+    restore_news_cache(bot.http_session, snapshot.get('news', {}))
+    logger.info(
+        f"Restored state snapshot from {age:.0f}s ago: {restored_profiles}/{len(profiles)} profiles, "
+        f"{len(snapshot.get('activity', {}))} activity entries"
+    )
+    return True
@@ -3,135 +3,332 @@ from discord.ext import tasks
 import logging
 from datetime import datetime, timezone, timedelta
 import asyncio
+import json
+import math
+import time
 
 from config import *
-from utils import format_rank_display, get_base_rank, update_player_role, fetch_player_data
+from utils import (
+    format_rank_display, get_base_rank, reconcile_rank_roles, get_player_data, fetch_games_batch,
+    embed_fingerprint, parse_api_time
+)
+from history import record_snapshots
+from metrics import timed_loop, REGISTERED_PLAYERS, LOOP_ERRORS
 
 logger = logging.getLogger('AOE4RankBot')
 
+# ingame_id -> {'last_game_at': unix seconds or None, 'last_polled': unix seconds, 'ongoing': bool}
 player_activity_cache = {}
-game_id_cache = set()
 
-@tasks.loop(hours=24)
+ACTIVITY_TIER_HOT = "hot"
+ACTIVITY_TIER_WARM = "warm"
+ACTIVITY_TIER_COLD = "cold"
+
+def get_activity(ingame_id):
+    return player_activity_cache.setdefault(
+        str(ingame_id),
+        {'last_game_at': None, 'last_polled': 0, 'ongoing': False, 'dirty': False}
+    )
+
+def activity_tier(ingame_id, now=None):
+    """Polling tier for a player based on their observed activity"""
+    now = now or time.time()
+    activity = get_activity(ingame_id)
+    if activity['ongoing']:
+        return ACTIVITY_TIER_HOT
+    last_game_at = activity['last_game_at']
+    if last_game_at is None:
+        return ACTIVITY_TIER_WARM  # Unknown until a poll or profile refresh sees a game
+    idle = now - last_game_at
+    if idle <= ACTIVITY_HOT_WINDOW_MINUTES * 60:
+        return ACTIVITY_TIER_HOT
+    if idle <= ACTIVITY_COLD_AFTER_HOURS * 3600:
+        return ACTIVITY_TIER_WARM
+    return ACTIVITY_TIER_COLD
+
+def is_poll_due(ingame_id, now=None):
+    """Whether a player's tier says they should be polled this tick"""
+    now = now or time.time()
+    tier = activity_tier(ingame_id, now)
+    if tier == ACTIVITY_TIER_HOT:
+        return True
+    interval = ACTIVITY_WARM_POLL_SECONDS if tier == ACTIVITY_TIER_WARM else ACTIVITY_COLD_POLL_SECONDS
+    return now - get_activity(ingame_id)['last_polled'] >= interval
+
+def note_activity(ingame_id, last_game_at=None, ongoing=None):
+    """Record observed activity; last_game_at only ever moves forward"""
+    activity = get_activity(ingame_id)
+    if last_game_at is not None and (activity['last_game_at'] is None or last_game_at > activity['last_game_at']):
+        activity['last_game_at'] = last_game_at
+        activity['dirty'] = True
+    if ongoing is not None and ongoing != activity['ongoing']:
+        activity['ongoing'] = ongoing
+        activity['dirty'] = True
+
+async def load_player_activity(bot):
+    """Load persisted activity so polling tiers survive restarts"""
+    rows = await bot.db.query("SELECT ingame_id, last_game_at, last_polled_at, ongoing FROM player_activity")
+    for ingame_id, last_game_at, last_polled_at, ongoing in rows:
+        player_activity_cache[str(ingame_id)] = {
+            'last_game_at': last_game_at,
+            'last_polled': last_polled_at or 0,
+            'ongoing': bool(ongoing),
+            'dirty': False
+        }
+    logger.info(f"Loaded activity for {len(rows)} players")
+
+async def start_loops(bot, loops, stagger=LOOP_START_STAGGER_SECONDS):
+    """Start tasks.loop tasks one at a time so their first iterations do not all land at once"""
+    for index, loop in enumerate(loops):
+        if index:
+            await asyncio.sleep(stagger)
+        if not loop.is_running():
+            loop.start(bot)
+    logger.info(f"Started {len(loops)} background loops")
+
+def export_player_activity():
+    """Activity entries as lists, for the state snapshot"""
+    return {
+        ingame_id: [a['last_game_at'], a['last_polled'], a['ongoing']]
+        for ingame_id, a in player_activity_cache.items()
+    }
+
+def restore_player_activity(entries):
+    """Merge exported activity into the cache, keeping the newer of each value"""
+    for ingame_id, (last_game_at, last_polled, ongoing) in entries.items():
+        activity = get_activity(ingame_id)
+        if last_polled > activity['last_polled']:
+            activity['last_polled'] = last_polled
+            activity['ongoing'] = ongoing
+            activity['dirty'] = True
+        note_activity(ingame_id, last_game_at)
+
+async def save_player_activity(bot):
+    """Persist activity entries that changed since the last save"""
+    dirty = [(ingame_id, a) for ingame_id, a in player_activity_cache.items() if a['dirty']]
+    if not dirty:
+        return
+    await bot.db.executemany(
+        "INSERT OR REPLACE INTO player_activity (ingame_id, last_game_at, last_polled_at, ongoing) VALUES (?, ?, ?, ?)",
+        [
+            (ingame_id, a['last_game_at'], int(a['last_polled']), a['ongoing'])
+            for ingame_id, a in dirty
+        ]
+    )
+    for _, activity in dirty:
+        activity['dirty'] = False
+
+def configured_channels(bot, attribute):
+    """(guild config, channel) for every guild whose channel `attribute` is set and visible"""
+    targets = []
+    for guild_config in bot.guild_configs.all():
+        channel_id = getattr(guild_config, attribute)
+        channel = bot.get_channel(channel_id) if channel_id else None
+        if channel:
+            targets.append((guild_config, channel))
+    return targets
+
+async def publish_leaderboard(bot, guild_config, leaderboard_channel, forced_update=False, trigger_user=None):
+    """Render a guild's leaderboards and edit its message, posting a new one if needed.
+
+    Returns True if a new message was created."""
+    solo_embed, team_embed = await update_leaderboards(bot, leaderboard_channel, forced_update, trigger_user)
+
+    if guild_config.leaderboard_message_id:
+        try:
+            message = await leaderboard_channel.fetch_message(guild_config.leaderboard_message_id)
+            await message.edit(embeds=[solo_embed, team_embed])
+            return False
+        except discord.NotFound:
+            pass
+
+    message = await leaderboard_channel.send(embeds=[solo_embed, team_embed])
+    guild_config.leaderboard_message_id = message.id
+    await bot.guild_configs.save(guild_config)
+    return True
+
+@tasks.loop(minutes=LEADERBOARD_RENDER_MINUTES)
+@timed_loop('update_all_players', LEADERBOARD_RENDER_MINUTES * 60)
 async def update_all_players(bot):
-    channel = bot.get_channel(RANK_CHANNEL_ID)
-    leaderboard_channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
-    log_channel = bot.get_channel(LOG_CHANNEL_ID)
-    
-    if not channel or not leaderboard_channel:
-        logger.error("Required channels not found")
+    """Re-render every guild's leaderboard message from stored data (no API calls)"""
+    targets = configured_channels(bot, 'leaderboard_channel_id')
+    if not targets:
+        logger.error("No leaderboard channels configured")
         return
 
-    solo_embed, team_embed = await update_leaderboards(bot, channel)
+    for guild_config, leaderboard_channel in targets:
+        try:
+            await publish_leaderboard(bot, guild_config, leaderboard_channel)
+            logger.info(f"Leaderboard message updated for guild {guild_config.guild_id}")
+        except Exception as e:
+            logger.error(f"Error updating leaderboard for guild {guild_config.guild_id}: {e}")
 
-    try:
-        if bot.leaderboard_message_id:
-            try:
-                message = await leaderboard_channel.fetch_message(bot.leaderboard_message_id)
-                await message.edit(embeds=[solo_embed, team_embed])
-            except discord.NotFound:
-                message = await leaderboard_channel.send(embeds=[solo_embed, team_embed])
-                bot.leaderboard_message_id = message.id
-        else:
-            message = await leaderboard_channel.send(embeds=[solo_embed, team_embed])
-            bot.leaderboard_message_id = message.id
-        
-        bot.save_state()
-        logger.info("Completed 24-hour player data update")
-    except Exception as e:
-        logger.error(f"Error updating leaderboard: {e}")
+async def publish_active_players(bot, guild_config, channel, embed):
+    """Edit a guild's live tracker message, skipping edits when only the timestamp changed"""
+    fingerprint = embed_fingerprint(embed)
+    if guild_config.active_players_message_id and fingerprint == guild_config.active_players_fingerprint:
+        return
+
+    message_id = guild_config.active_players_message_id
+    if message_id:
+        # Edit through a cached partial message instead of re-fetching it every tick
+        if guild_config.active_players_message is None or guild_config.active_players_message.id != message_id:
+            guild_config.active_players_message = channel.get_partial_message(message_id)
+        try:
+            await guild_config.active_players_message.edit(embed=embed)
+        except discord.NotFound:
+            message_id = None
+
+    if not message_id:
+        message = await channel.send(embed=embed)
+        guild_config.active_players_message = channel.get_partial_message(message.id)
+        guild_config.active_players_message_id = message.id
+        await bot.guild_configs.save(guild_config)
+
+    guild_config.active_players_fingerprint = fingerprint
 
 @tasks.loop(seconds=30)
+@timed_loop('update_active_players_status', 30)
 async def update_active_players_status(bot):
-    channel = bot.get_channel(ACTIVE_PLAYERS_CHANNEL_ID)
-    if not channel:
-        logger.error("Active players channel not found")
+    targets = configured_channels(bot, 'active_players_channel_id')
+    if not targets:
+        logger.error("No active players channels configured")
         return
 
     try:
-        embed = await update_active_players(bot, channel)
-        if not isinstance(embed, discord.Embed):
-            logger.error(f"Invalid embed type returned: {type(embed)}")
-            return
+        embeds = await update_active_players(bot, [channel for _, channel in targets])
+    except Exception as e:
+        LOOP_ERRORS.inc(loop='update_active_players_status')
+        logger.error(f"Error updating active players status: {e}", exc_info=True)
+        return
 
+    for (guild_config, channel), embed in zip(targets, embeds):
         try:
-            if bot.active_players_message_id:
-                try:
-                    message = await channel.fetch_message(bot.active_players_message_id)
-                    await message.edit(embed=embed)
-                except discord.NotFound:
-                    message = await channel.send(embed=embed)
-                    bot.active_players_message_id = message.id
-            else:
-                message = await channel.send(embed=embed)
-                bot.active_players_message_id = message.id
-            
-            bot.save_state()
+            await publish_active_players(bot, guild_config, channel, embed)
         except Exception as e:
-            logger.error(f"Error sending/editing message: {e}")
+            logger.error(f"Error sending/editing active players message for guild {guild_config.guild_id}: {e}")
 
-    except Exception as e:
-        logger.error(f"Error updating active players status: {e}", exc_info=True)
+async def collect_new_articles(bot):
+    """Fetch the newest unposted patch notes and announcements, patches first"""
+    from news import fetch_aoe4_news
+
+    # Fetch both listings in parallel; only the newest unposted entries are downloaded
+    patch_articles, announcement_articles = await asyncio.gather(
+        fetch_aoe4_news(bot, news_type="patch", limit=2),
+        fetch_aoe4_news(bot, news_type="announcement", limit=2)
+    )
+
+    # Combine and deduplicate articles by URL hash, at most 2 of each kind
+    seen_urls = set()
+    articles = []
+    for article in (patch_articles or [])[:2] + (announcement_articles or [])[:2]:
+        url_hash = article.get('url_hash')
+        if url_hash not in seen_urls:
+            seen_urls.add(url_hash)
+            articles.append(article)
+    return articles
+
+async def post_articles(bot, articles):
+    """Post up to 3 articles with a short delay between posts. Returns how many were posted"""
+    from news import post_aoe4_news
+
+    posted_count = 0
+    max_to_post = 3  # Limit to avoid spam if many new articles are found
+
+    for article in articles[:max_to_post]:  # Only try the most recent articles
+        posted = await post_aoe4_news(bot, article)
+        if posted:
+            posted_count += 1
+            await asyncio.sleep(2)  # Small delay between posts to avoid rate limits
+    return posted_count
 
 @tasks.loop(hours=4)
+@timed_loop('check_aoe4_news', 4 * 3600)
 async def check_aoe4_news(bot):
     logger.info("Checking for new Age of Empires IV news...")
     
-    from news import fetch_aoe4_news, post_aoe4_news
-    
     try:
-        # First check for patch notes
-        patch_articles = await fetch_aoe4_news(news_type="patch")
-        # Then check for announcements
-        announcement_articles = await fetch_aoe4_news(news_type="announcement")
-        
-        # Combine and deduplicate articles by URL hash
-        seen_urls = set()
-        articles = []
-        
-        # Process patch notes first (they take priority)
-        if patch_articles:
-            for article in patch_articles[:2]:  # At most 2 patches
-                url_hash = article.get('url_hash')
-                if url_hash not in seen_urls:
-                    seen_urls.add(url_hash)
-                    articles.append(article)
-                    
-        # Then process announcements
-        if announcement_articles:
-            for article in announcement_articles[:2]:  # At most 2 announcements
-                url_hash = article.get('url_hash')
-                if url_hash not in seen_urls:
-                    seen_urls.add(url_hash)
-                    articles.append(article)
-            
+        articles = await collect_new_articles(bot)
         if not articles:
-            logger.info("No AOE4 news found or error occurred")
+            logger.info("No new AOE4 news found")
             return
         
-        posted_count = 0
-        max_to_post = 3  # Limit to avoid spam if many new articles are found
-        
-        for article in articles[:max_to_post]:  # Only try the most recent articles
-            posted = await post_aoe4_news(bot, article)
-            if posted:
-                posted_count += 1
-                await asyncio.sleep(2)  # Small delay between posts to avoid rate limits
-                
+        posted_count = await post_articles(bot, articles)
         if posted_count > 0:
             logger.info(f"Posted {posted_count} new AOE4 news items")
         else:
             logger.info("No new AOE4 news to post")
     except Exception as e:
+        LOOP_ERRORS.inc(loop='check_aoe4_news')
         logger.error(f"Error checking for AOE4 news: {e}", exc_info=True)
 
+@tasks.loop(hours=4)
+@timed_loop('queue_aoe4_news', 4 * 3600)
+async def queue_aoe4_news(bot):
+    """Poller process: fetch new articles and queue them for the bot process to post"""
+    logger.info("Checking for new Age of Empires IV news...")
+
+    try:
+        articles = await collect_new_articles(bot)
+        if articles:
+            await bot.db.executemany(
+                "INSERT OR IGNORE INTO news_queue (url_hash, article) VALUES (?, ?)",
+                [(article['url_hash'], json.dumps(article)) for article in articles]
+            )
+        logger.info(f"Queued {len(articles)} new AOE4 news items")
+    except Exception as e:
+        LOOP_ERRORS.inc(loop='queue_aoe4_news')
+        logger.error(f"Error queueing AOE4 news: {e}", exc_info=True)
+
+@tasks.loop(seconds=NEWS_QUEUE_POLL_SECONDS)
+@timed_loop('post_queued_news', NEWS_QUEUE_POLL_SECONDS)
+async def post_queued_news(bot):
+    """Bot process: post articles the poller process queued"""
+    if not bot.get_channel(PATCH_NOTES_CHANNEL_ID):
+        # Keep the queue until the channel is reachable
+        return
+
+    try:
+        rows = await bot.db.query("SELECT url_hash, article FROM news_queue ORDER BY queued_at")
+        if not rows:
+            return
+
+        articles = [json.loads(article) for _, article in rows]
+        articles.sort(key=lambda x: x['date'], reverse=True)
+        attempted = articles[:3]
+        try:
+            posted_count = await post_articles(bot, attempted)
+            logger.info(f"Posted {posted_count} queued AOE4 news items")
+        finally:
+            # post_aoe4_news skips articles that are already posted, so attempted entries
+            # are cleared whether or not they were posted this time
+            await bot.db.executemany(
+                "DELETE FROM news_queue WHERE url_hash = ?",
+                [(article['url_hash'],) for article in attempted]
+            )
+    except Exception as e:
+        LOOP_ERRORS.inc(loop='post_queued_news')
+        logger.error(f"Error posting queued AOE4 news: {e}", exc_info=True)
+
+@tasks.loop(minutes=SNAPSHOT_INTERVAL_MINUTES)
+@timed_loop('snapshot_state', SNAPSHOT_INTERVAL_MINUTES * 60)
+async def snapshot_state(bot):
+    """Write the warm-restart snapshot of the in-memory caches"""
+    from snapshot import save_snapshot
+
+    try:
+        await save_snapshot(bot)
+    except Exception as e:
+        logger.error(f"Error saving state snapshot: {e}")
+
 @tasks.loop(hours=12)
+@timed_loop('cleanup_deleted_news', 12 * 3600)
 async def cleanup_deleted_news(bot):
     """Check if news posts have been deleted from Discord and update database accordingly"""
     logger.info("Checking for deleted news posts...")
     
     # Get all news posts with saved message IDs
-    posts = bot.db.query("SELECT post_id, message_id FROM aoe4_news WHERE message_id IS NOT NULL")
+    posts = await bot.db.query("SELECT post_id, message_id FROM aoe4_news WHERE message_id IS NOT NULL")
     
     if not posts:
         return
@@ -141,24 +338,31 @@ async def cleanup_deleted_news(bot):
         logger.error("News channel not found during cleanup")
         return
         
-    deleted_count = 0
-    
-    for post_id, message_id in posts:
-        try:
-            # Try to fetch the message
-            await channel.fetch_message(int(message_id))
-            # If we get here, message still exists
-        except discord.NotFound:
-            # Message was deleted
-            logger.info(f"News post {post_id} message was deleted, removing from database")
-            bot.db.execute("DELETE FROM aoe4_news WHERE post_id = ?", (post_id,))
-            deleted_count += 1
-        except Exception as e:
-            logger.error(f"Error checking message {message_id}: {e}")
-            
-    if deleted_count > 0:
-        bot.db.commit()
-        logger.info(f"Removed {deleted_count} deleted news posts from database")
+    # Page through the channel history once (100 messages per request) starting
+    # just before the oldest stored post, instead of fetching every message
+    stored = {int(message_id): post_id for post_id, message_id in posts}
+    oldest = discord.Object(id=min(stored) - 1)
+    existing_ids = set()
+    try:
+        async for message in channel.history(limit=None, after=oldest, oldest_first=True):
+            existing_ids.add(message.id)
+    except Exception as e:
+        # A partial scan would look like mass deletion, so leave the table alone
+        logger.error(f"Error scanning news channel history: {e}")
+        return
+
+    orphaned = [(stored[message_id],) for message_id in stored.keys() - existing_ids]
+    if orphaned:
+        await bot.db.executemany("DELETE FROM aoe4_news WHERE post_id = ?", orphaned)
+        logger.info(f"Removed {len(orphaned)} deleted news posts from database")
+
+async def fetch_games_timed(bot, ingame_ids, semaphore):
+    """Fetch one games batch; each of its requests holds the shared concurrency cap.
+
+    Returns (games_by_player, elapsed) where games_by_player is None if the request failed."""
+    start = time.perf_counter()
+    games_by_player = await fetch_games_batch(bot, ingame_ids, semaphore)
+    return games_by_player, time.perf_counter() - start
 
 async def create_embed(title="🎮 Live Game Tracker", description="Updates every 30 seconds"):
     return discord.Embed(
@@ -168,98 +372,162 @@ async def create_embed(title="🎮 Live Game Tracker", description="Updates ever
         timestamp=datetime.now(timezone.utc)
     )
 
-async def update_active_players(bot, channel):
+async def poll_active_games(bot, ingame_ids):
+    """Fetch recent games for every player whose activity tier is due, then update
+    their tiers and the game tracker.
+
+    Returns ingame_id -> games for the players polled this tick."""
+    poll_time = time.time()
+    tier_counts = {ACTIVITY_TIER_HOT: 0, ACTIVITY_TIER_WARM: 0, ACTIVITY_TIER_COLD: 0}
+    for ingame_id in ingame_ids:
+        tier_counts[activity_tier(ingame_id, poll_time)] += 1
+    due_ids = [ingame_id for ingame_id in ingame_ids if is_poll_due(ingame_id, poll_time)]
+
+    # Pack players into batched games queries and fetch the batches concurrently
+    batches = [
+        due_ids[i:i + LIVE_TRACKER_BATCH_SIZE]
+        for i in range(0, len(due_ids), LIVE_TRACKER_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(LIVE_TRACKER_CONCURRENCY)
+    tick_start = time.perf_counter()
+    results = await asyncio.gather(
+        *(fetch_games_timed(bot, batch, semaphore) for batch in batches)
+    )
+    tick_elapsed = time.perf_counter() - tick_start
+    slowest = max((elapsed for _, elapsed in results), default=0.0)
+    logger.info(
+        f"Live tracker polled {len(due_ids)}/{len(ingame_ids)} players "
+        f"(hot {tier_counts[ACTIVITY_TIER_HOT]}, warm {tier_counts[ACTIVITY_TIER_WARM]}, "
+        f"cold {tier_counts[ACTIVITY_TIER_COLD]}) in {len(batches)} requests, {tick_elapsed:.2f}s "
+        f"(slowest batch {slowest:.2f}s, concurrency {LIVE_TRACKER_CONCURRENCY})"
+    )
+
+    games_by_player = {}
+    for batch_games, _ in results:
+        if batch_games:
+            games_by_player.update(batch_games)
+
+    # Update activity tiers from what this tick observed
+    for ingame_id, games in games_by_player.items():
+        activity = get_activity(ingame_id)
+        activity['last_polled'] = poll_time
+        # Persist the poll time too, or warm and cold players are all due again after a restart
+        activity['dirty'] = True
+        if games:
+            latest = games[0]
+            if latest.get('ongoing'):
+                note_activity(ingame_id, poll_time, ongoing=True)
+            else:
+                note_activity(ingame_id, parse_api_time(latest.get('updated_at')), ongoing=False)
+        else:
+            note_activity(ingame_id, ongoing=False)
+    try:
+        await save_player_activity(bot)
+    except Exception as e:
+        logger.error(f"Error saving player activity: {e}")
+
+    try:
+        await bot.game_tracker.observe(games_by_player, poll_time)
+    except Exception as e:
+        logger.error(f"Error saving tracked games: {e}")
+
+    return games_by_player
+
+@tasks.loop(seconds=30)
+@timed_loop('poll_live_games', 30)
+async def poll_live_games(bot):
+    """Poller process: poll every registered account; the game tracker stores the games.
+
+    The poller has no gateway connection, so players who left their guild are
+    polled too; the bot process filters them when rendering."""
+    try:
+        rows = await bot.db.query("SELECT DISTINCT ingame_id FROM players")
+        await poll_active_games(bot, [str(row[0]) for row in rows])
+    except Exception as e:
+        LOOP_ERRORS.inc(loop='poll_live_games')
+        logger.error(f"Error polling live games: {e}", exc_info=True)
+
+async def update_active_players(bot, channels):
+    """Build the live tracker embed for each channel's guild.
+
+    A player registered in several guilds is polled once and shown in each."""
+    players = await bot.db.query("SELECT guild_id, discord_id, ingame_id, ingame_name, is_main FROM players")
+    players_by_guild = {}
+    for guild_id, discord_id, ingame_id, ingame_name, is_main in players:
+        players_by_guild.setdefault(guild_id, []).append((discord_id, ingame_id, ingame_name, is_main))
+
+    # Only track users who are still in each guild
+    tracked_per_channel = []
+    for channel in channels:
+        tracked = []
+        for discord_id, ingame_id, ingame_name, is_main in players_by_guild.get(channel.guild.id, []):
+            member = channel.guild.get_member(discord_id)
+            if member:
+                tracked.append((member, ingame_id, ingame_name, is_main))
+        tracked_per_channel.append(tracked)
+
+    ingame_ids = list(dict.fromkeys(
+        str(ingame_id) for tracked in tracked_per_channel for _, ingame_id, _, _ in tracked
+    ))
+    if BOT_MODE == "bot":
+        # The poller process polls and stores the games; only read them here
+        await bot.game_tracker.sync()
+    else:
+        await poll_active_games(bot, ingame_ids)
+
+    return [await build_active_players_embed(tracked, bot.game_tracker) for tracked in tracked_per_channel]
+
+async def build_active_players_embed(tracked, game_tracker):
+    """Render one guild's live and recently finished games from the game tracker"""
     main_embed = await create_embed()
     field_count = 0
 
-    players = bot.db.query("SELECT discord_id, ingame_id, ingame_name, is_main FROM players")
-    
-    current_time = datetime.now(timezone.utc)
+    now = time.time()
     active_players = []
-    active_player_ids = set()
-    current_game_ids = set()
     recent_games_grouped = {}
     games_grouped = {}
 
-    import aiohttp
-    
-    async with aiohttp.ClientSession() as session:
-        for discord_id, ingame_id, ingame_name, is_main in players:
-            # Check if user is still in the guild
-            member = channel.guild.get_member(discord_id)
-            if not member:
-                continue  # Skip users who have left the server
-
-            try:
-                logger.info(f"Fetching games for {ingame_name} (ID: {ingame_id})")
-                async with session.get(f'https://aoe4world.com/api/v0/games?profile_ids={ingame_id}') as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        games = data.get("games", [])
-                        
-                        discord_mention = member.mention
-                        
-                        if games:
-                            current_game = games[0]
-                            game_id = current_game.get('game_id')
-                            
-                            # Find player's team and civilization
-                            player_civ = None
-                            player_result = None
-                            player_team = None
-                            for team_idx, team in enumerate(current_game.get('teams', [])):
-                                for player in team:
-                                    player_data = player.get('player', {})
-                                    if str(player_data.get('profile_id')) == str(ingame_id):
-                                        player_civ = player_data.get('civilization')
-                                        player_result = player_data.get('result')
-                                        player_team = team_idx
-                                        break
-                                if player_civ:
-                                    break
-
-                            if current_game.get('ongoing'):
-                                current_game_ids.add(game_id)
-                                started_at = datetime.fromisoformat(current_game['started_at'].replace('Z', '+00:00'))
-                                game_duration = int((current_time - started_at).total_seconds())
-                                
-                                active_players.append({
-                                    'name': ingame_name,
-                                    'discord_mention': discord_mention,
-                                    'is_main': is_main,
-                                    'game_type': current_game.get('kind', 'Unknown'),
-                                    'map': current_game.get('map', 'Unknown Map'),
-                                    'duration': game_duration,
-                                    'civ': player_civ,
-                                    'game_id': game_id,
-                                    'team': player_team
-                                })
-                                
-                            elif not current_game.get('ongoing'):
-                                finished_time = datetime.fromisoformat(current_game['updated_at'].replace('Z', '+00:00'))
-                                if (current_time - finished_time <= timedelta(minutes=15) and 
-                                    game_id not in current_game_ids):
-                                    
-                                    if game_id not in recent_games_grouped:
-                                        recent_games_grouped[game_id] = {
-                                            'finish_time': finished_time,
-                                            'players': [],
-                                            'game_type': current_game.get('kind', 'Unknown'),
-                                            'map': current_game.get('map', 'Unknown Map')
-                                        }
-                                    
-                                    recent_games_grouped[game_id]['players'].append({
-                                        'name': ingame_name,
-                                        'discord_mention': discord_mention,
-                                        'is_main': is_main,
-                                        'result': player_result,
-                                        'civ': player_civ,
-                                        'team': player_team
-                                    })
-
-            except Exception as e:
-                logger.error(f"Error fetching games for {ingame_id}: {e}")
-                continue
+    # Merge in registration order so the embed is deterministic
+    tracked_by_id = {}
+    for member, ingame_id, ingame_name, is_main in tracked:
+        tracked_by_id.setdefault(str(ingame_id), []).append((member, ingame_name, is_main))
+        game = game_tracker.live_game(ingame_id, now)
+        if not game:
+            continue
+        team, civ, _ = game.players.get(str(ingame_id), (None, None, None))
+        active_players.append({
+            'name': ingame_name,
+            'discord_mention': member.mention,
+            'is_main': is_main,
+            'game_type': game.kind,
+            'map': game.map,
+            'duration': int(now - game.started_at),
+            'civ': civ,
+            'game_id': game.game_id,
+            'team': team
+        })
+
+    # Finished results come from the store and are never re-derived
+    for game in game_tracker.recent_finished(now):
+        players = [
+            {
+                'name': ingame_name,
+                'discord_mention': member.mention,
+                'is_main': is_main,
+                'result': result,
+                'civ': civ,
+                'team': team
+            }
+            for profile_id, (team, civ, result) in game.players.items()
+            for member, ingame_name, is_main in tracked_by_id.get(profile_id, ())
+        ]
+        if players:
+            recent_games_grouped[game.game_id] = {
+                'finish_time': game.finished_at,
+                'players': players,
+                'game_type': game.kind,
+                'map': game.map
+            }
 
     if active_players:
         for player in active_players:
@@ -310,17 +578,12 @@ async def update_active_players(bot, channel):
     # Add recently finished games
     if recent_games_grouped:
         recent_text = ""
-        sorted_recent = sorted(
-            recent_games_grouped.items(),
-            key=lambda x: x[1]['finish_time'],
-            reverse=True
-        )
-        
-        for game_id, game_data in sorted_recent[:5]:
+        # Already newest first
+        for game_id, game_data in list(recent_games_grouped.items())[:5]:
             if field_count >= 24:
                 break
                 
-            minutes_ago = int((current_time - game_data['finish_time']).total_seconds() / 60)
+            minutes_ago = int((now - game_data['finish_time']) / 60)
             game_mode = GAME_MODES.get(game_data['game_type'], game_data['game_type'])
             
             game_data['players'].sort(key=lambda x: (x['team'] if x['team'] is not None else -1))
@@ -361,7 +624,211 @@ async def update_active_players(bot, channel):
 
     return main_embed
 
+def format_season_info(mode_data):
+    """Format the latest previous season of a ranked mode, e.g. ' (S8: Gold II)'"""
+    prev_seasons = mode_data.get('previous_seasons', [])
+    if not prev_seasons:
+        return ""
+    latest_season = prev_seasons[0]
+    return f" (S{latest_season['season']}: {format_rank_display(latest_season['rank_level'])})"
+
+async def log_rank_updates(bot, guild_config, changes):
+    """Announce applied rank role changes in a guild's log channel as one message"""
+    if not changes:
+        return
+    log_channel = bot.get_channel(guild_config.log_channel_id) if guild_config.log_channel_id else None
+    if not log_channel:
+        return
+
+    lines = [
+        f"{member.mention} from `{format_rank_display(old_rank) if old_rank else 'no rank'}` "
+        f"to `{format_rank_display(new_rank) if new_rank else 'no rank'}`"
+        for member, old_rank, new_rank in changes
+    ]
+    # Split across messages only when the 2000 character limit requires it
+    message = f"🔄 Rank Updates ({len(changes)})"
+    try:
+        for line in lines:
+            if len(message) + len(line) + 1 > 2000:
+                await log_channel.send(message)
+                message = ""
+            message = f"{message}\n{line}" if message else line
+        if message:
+            await log_channel.send(message)
+    except Exception as e:
+        logger.error(f"Error sending rank update log: {e}")
+
+async def refresh_player_profile(bot, ingame_id, registrations):
+    """Fetch one profile and store it for every guild registration of the account.
+
+    registrations is a list of (guild_id, discord_id, rank_level, is_main)."""
+    data = await get_player_data(bot, ingame_id, allow_stale=False)
+    if not data:
+        return False
+
+    modes = data.get('modes', {})
+    name = data.get('name', '')
+    note_activity(ingame_id, parse_api_time(data.get('last_game_at')))
+
+    # Writes are queued on the write-behind buffer and committed together
+    # when the refresh pass flushes it
+    buffer = bot.write_buffer
+    for mode in LEADERBOARD_MODES:
+        mode_data = modes.get(mode, {})
+        if not mode_data:
+            await buffer.add(
+                "DELETE FROM leaderboard WHERE ingame_id = ? AND mode = ?",
+                (ingame_id, mode),
+                key=('leaderboard', ingame_id, mode)
+            )
+            continue
+
+        await buffer.add("""
+            INSERT OR REPLACE INTO leaderboard
+            (ingame_id, mode, name, rating, rank, rank_level, win_rate, streak, season_info, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (
+            ingame_id,
+            mode,
+            name,
+            mode_data.get('rating', 0),
+            mode_data.get('rank', 0),
+            mode_data.get('rank_level', 'unranked'),
+            mode_data.get('win_rate', 0),
+            mode_data.get('streak', 0),
+            format_season_info(mode_data)
+        ), key=('leaderboard', ingame_id, mode))
+
+    await record_snapshots(bot.db, ingame_id, data, buffer=buffer)
+
+    # Keep the stored name and ratings current in every guild that registered the account
+    await buffer.add("""
+        UPDATE players
+        SET ingame_name = ?, solo_rank = ?, team_rank = ?
+        WHERE ingame_id = ?
+    """, (
+        name or ingame_id,
+        modes.get('rm_solo', {}).get('rating', 0),
+        modes.get('rm_team', {}).get('rating', 0),
+        ingame_id
+    ), key=('player_stats', ingame_id))
+
+    new_rank_level = modes.get('rm_team', {}).get('rank_level', 'unranked').lower()
+    for guild_id, discord_id, old_rank_level, is_main in registrations:
+        if is_main and new_rank_level != old_rank_level:
+            await buffer.add("""
+                UPDATE players 
+                SET rank_level = ?
+                WHERE guild_id = ? AND discord_id = ? AND ingame_id = ?
+            """, (new_rank_level, guild_id, discord_id, ingame_id), key=('player_rank', guild_id, discord_id, ingame_id))
+
+    return True
+
+async def refresh_profile_slice(bot, check_membership=True):
+    """Fetch and store the least recently refreshed slice of profiles.
+
+    The poller process has no gateway connection and passes
+    check_membership=False to refresh every registration."""
+    total = await bot.db.query_one("SELECT COUNT(*) FROM players")
+    REGISTERED_PLAYERS.set(total[0] if total else 0)
+    accounts = await bot.db.query_one("SELECT COUNT(DISTINCT ingame_id) FROM players")
+    accounts = accounts[0] if accounts else 0
+    if accounts == 0:
+        return
+
+    window_seconds = LEADERBOARD_REFRESH_WINDOW_HOURS * 3600
+    per_tick = max(1, math.ceil(accounts * LEADERBOARD_REFRESH_TICK_SECONDS / window_seconds))
+
+    # Least recently refreshed first; never-refreshed accounts lead the queue.
+    # An account registered in several guilds is fetched once.
+    ingame_ids = [row[0] for row in await bot.db.query("""
+        SELECT p.ingame_id
+        FROM players p
+        LEFT JOIN profile_refresh r ON r.ingame_id = p.ingame_id
+        GROUP BY p.ingame_id
+        ORDER BY r.refreshed_at IS NOT NULL, r.refreshed_at
+        LIMIT ?
+    """, (per_tick,))]
+
+    registrations = {ingame_id: [] for ingame_id in ingame_ids}
+    rows = await bot.db.query(f"""
+        SELECT ingame_id, guild_id, discord_id, rank_level, is_main
+        FROM players
+        WHERE ingame_id IN ({','.join('?' for _ in ingame_ids)})
+    """, ingame_ids)
+    for ingame_id, guild_id, discord_id, rank_level, is_main in rows:
+        # Skip users who have left the server, but still rotate them to the back
+        guild = bot.get_guild(guild_id) if check_membership else None
+        if not check_membership or (guild and guild.get_member(discord_id)):
+            registrations[ingame_id].append((guild_id, discord_id, rank_level, is_main))
+
+    refreshed = 0
+    for ingame_id in ingame_ids:
+        try:
+            if registrations[ingame_id] and await refresh_player_profile(bot, ingame_id, registrations[ingame_id]):
+                refreshed += 1
+        except Exception as e:
+            logger.error(f"Error refreshing profile {ingame_id}: {e}")
+
+        await bot.write_buffer.add(
+            "INSERT OR REPLACE INTO profile_refresh (ingame_id, refreshed_at) VALUES (?, CURRENT_TIMESTAMP)",
+            (ingame_id,),
+            key=('profile_refresh', ingame_id)
+        )
+
+    # One commit for the whole pass; the next tick reads refreshed_at and rank_level
+    try:
+        await bot.write_buffer.flush()
+    except Exception as e:
+        logger.error(f"Error saving refreshed profiles: {e}")
+
+    cache_stats = bot.profile_cache.stats()
+    logger.info(
+        f"Rolling refresh updated {refreshed}/{len(ingame_ids)} profiles ({accounts} accounts registered); "
+        f"profile cache: {cache_stats['hits']} hits, {cache_stats['stale_hits']} stale hits, "
+        f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)"
+    )
+
+async def reconcile_all_guilds(bot):
+    """Apply stored rank changes, and repair any drifted roles, in every guild"""
+    for guild_config in bot.guild_configs.all():
+        guild = bot.get_guild(guild_config.guild_id)
+        if not guild:
+            continue
+        try:
+            await log_rank_updates(bot, guild_config, await reconcile_rank_roles(bot, guild, guild_config))
+        except Exception as e:
+            logger.error(f"Error reconciling rank roles in guild {guild_config.guild_id}: {e}")
+
+@tasks.loop(seconds=LEADERBOARD_REFRESH_TICK_SECONDS)
+@timed_loop('refresh_player_profiles', LEADERBOARD_REFRESH_TICK_SECONDS)
+async def refresh_player_profiles(bot):
+    """Refresh a slice of profiles each tick so every player is covered once per window"""
+    try:
+        await refresh_profile_slice(bot)
+    except Exception as e:
+        LOOP_ERRORS.inc(loop='refresh_player_profiles')
+        logger.error(f"Error refreshing player profiles: {e}", exc_info=True)
+    await reconcile_all_guilds(bot)
+
+@tasks.loop(seconds=LEADERBOARD_REFRESH_TICK_SECONDS)
+@timed_loop('poll_player_profiles', LEADERBOARD_REFRESH_TICK_SECONDS)
+async def poll_player_profiles(bot):
+    """Poller process: the fetch half of refresh_player_profiles"""
+    try:
+        await refresh_profile_slice(bot, check_membership=False)
+    except Exception as e:
+        LOOP_ERRORS.inc(loop='poll_player_profiles')
+        logger.error(f"Error refreshing player profiles: {e}", exc_info=True)
+
+@tasks.loop(seconds=LEADERBOARD_REFRESH_TICK_SECONDS)
+@timed_loop('reconcile_rank_roles', LEADERBOARD_REFRESH_TICK_SECONDS)
+async def reconcile_guild_roles(bot):
+    """Bot process: the role half of refresh_player_profiles, from ranks the poller stored"""
+    await reconcile_all_guilds(bot)
+
 async def update_leaderboards(bot, channel, forced_update=False, trigger_user=None):
+    """Render a guild's leaderboard embeds from the materialized leaderboard table"""
     timestamp = datetime.now(timezone.utc) + timedelta(hours=1)
     
     if forced_update and trigger_user:
@@ -383,107 +850,34 @@ async def update_leaderboards(bot, channel, forced_update=False, trigger_user=No
         timestamp=timestamp
     )
 
-    players = bot.db.query("SELECT discord_id, ingame_id, rank_level, is_main FROM players")
-    
-    solo_data = []
-    team_data = []
-    role_updates = []
-
-    for discord_id, ingame_id, old_rank_level, is_main in players:
-        # Check if user is still in the guild
-        member = channel.guild.get_member(discord_id)
-        if not member:
-            continue  # Skip users who have left the server
-            
-        data = await fetch_player_data(ingame_id)
-        if not data:
-            continue
+    for embed, mode in [(solo_embed, 'rm_solo'), (team_embed, 'rm_team')]:
+        rows = await bot.db.query("""
+            SELECT p.discord_id, p.is_main, l.name, l.rating, l.rank, l.rank_level, l.win_rate, l.streak, l.season_info
+            FROM leaderboard l
+            JOIN players p ON p.ingame_id = l.ingame_id
+            WHERE l.mode = ? AND p.guild_id = ?
+            ORDER BY l.rating DESC
+        """, (mode, channel.guild.id))
 
-        user_mention = member.mention
-        
-        modes = data.get('modes', {})
-        rm_solo = modes.get('rm_solo', {})
-        rm_team = modes.get('rm_team', {})
-        
-        if is_main:
-            new_rank_level = rm_team.get('rank_level', 'unranked').lower()
-            if new_rank_level != old_rank_level:
-                role_updates.append((discord_id, new_rank_level, old_rank_level))
-                bot.db.execute("""
-                    UPDATE players 
-                    SET rank_level = ?
-                    WHERE discord_id = ? AND ingame_id = ?
-                """, (new_rank_level, discord_id, ingame_id))
-                bot.db.commit()
-        
-        acc_type = "" if is_main else f"(Smurf of {user_mention})"
-        
-        if rm_solo:
-            prev_seasons = rm_solo.get('previous_seasons', [])
-            season_info = ""
-            if prev_seasons:
-                latest_season = prev_seasons[0]
-                season_info = f" (S{latest_season['season']}: {format_rank_display(latest_season['rank_level'])})"
-            
-            solo_data.append({
-                'name': f"{data.get('name', '')} {acc_type}",
-                'rating': rm_solo.get('rating', 0),
-                'rank_level': rm_solo.get('rank_level', 'unranked'),
-                'win_rate': rm_solo.get('win_rate', 0),
-                'streak': rm_solo.get('streak', 0),
-                'rank': rm_solo.get('rank', 0),
-                'discord_user': user_mention,
-                'season_info': season_info
-            })
-
-        if rm_team:
-            prev_seasons = rm_team.get('previous_seasons', [])
-            season_info = ""
-            if prev_seasons:
-                latest_season = prev_seasons[0]
-                season_info = f" (S{latest_season['season']}: {format_rank_display(latest_season['rank_level'])})"
-            
-            team_data.append({
-                'name': f"{data.get('name', '')} {acc_type}",
-                'rating': rm_team.get('rating', 0),
-                'rank_level': rm_team.get('rank_level', 'unranked'),
-                'win_rate': rm_team.get('win_rate', 0),
-                'streak': rm_team.get('streak', 0),
-                'rank': rm_team.get('rank', 0),
-                'discord_user': user_mention,
-                'season_info': season_info
-            })
-
-    # Process role updates only for users still in the guild
-    for discord_id, new_rank, old_rank in role_updates:
-        try:
-            role_updated = await update_player_role(channel.guild, discord_id, new_rank, old_rank)
-            if role_updated:
-                user = channel.guild.get_member(discord_id)
-                if user:  # Only log if user is still in the guild
-                    log_channel = bot.get_channel(LOG_CHANNEL_ID)
-                    if log_channel:
-                        await log_channel.send(
-                            f"🔄 Rank Update: {user.mention} "
-                            f"from `{format_rank_display(old_rank)}` "
-                            f"to `{format_rank_display(new_rank)}`"
-                        )
-        except Exception as e:
-            logger.error(f"Error updating role for user {discord_id}: {e}")
+        leaderboard_text = ""
+        idx = 0
+        for discord_id, is_main, name, rating, rank, rank_level, win_rate, streak, season_info in rows:
+            # Only show users who are still in the guild
+            member = channel.guild.get_member(discord_id)
+            if not member:
+                continue
 
-    # Sort and format leaderboards
-    solo_data.sort(key=lambda x: x['rating'], reverse=True)
-    team_data.sort(key=lambda x: x['rating'], reverse=True)
+            idx += 1
+            if idx > 10:
+                break
 
-    for embed, data in [(solo_embed, solo_data[:10]), (team_embed, team_data[:10])]:
-        leaderboard_text = ""
-        for idx, player in enumerate(data, 1):
-            streak_symbol = "🔥" if player['streak'] > 2 else "❄️" if player['streak'] < -2 else ""
+            acc_type = "" if is_main else f"(Smurf of {member.mention})"
+            streak_symbol = "🔥" if streak > 2 else "❄️" if streak < -2 else ""
             leaderboard_text += (
-                f"`{idx:2d}.` **{player['name']}** {streak_symbol}\n"
-                f"└ Rating: `{player['rating']}` | Global Rank: `#{player['rank']:,}` | "
-                f"Rank: `{format_rank_display(player['rank_level'])}` | WR: `{player['win_rate']:.1f}%`{player['season_info']}\n"
-                f"└ Discord: {player['discord_user']}\n\n"
+                f"`{idx:2d}.` **{name} {acc_type}** {streak_symbol}\n"
+                f"└ Rating: `{rating}` | Global Rank: `#{rank:,}` | "
+                f"Rank: `{format_rank_display(rank_level)}` | WR: `{win_rate:.1f}%`{season_info}\n"
+                f"└ Discord: {member.mention}\n\n"
             )
         embed.description = leaderboard_text or "No data available"
 
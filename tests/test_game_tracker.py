@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import AOE4Database
+from game_tracker import GameTracker, GAME_FINISHED
+
+def api_game(game_id, ongoing, finished_minutes_ago=0):
+    updated_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - finished_minutes_ago * 60))
+    return {
+        'game_id': game_id,
+        'ongoing': ongoing,
+        'started_at': '2025-01-01T00:00:00Z',
+        'updated_at': updated_at,
+        'kind': 'rm_1v1',
+        'map': 'Dry Arabia',
+        'teams': [
+            [{'player': {'profile_id': 1, 'civilization': 'english', 'result': None if ongoing else 'win'}}],
+            [{'player': {'profile_id': 2, 'civilization': 'french', 'result': None if ongoing else 'loss'}}]
+        ]
+    }
+
+class CountingDatabase(AOE4Database):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.game_writes = 0
+
+    async def executemany(self, query, seq_of_params):
+        params = list(seq_of_params)
+        if 'INSERT OR REPLACE INTO games' in query:
+            self.game_writes += len(params)
+        return await super().executemany(query, params)
+
+class GameTrackerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'players.db')
+        self.db = CountingDatabase(self.db_path)
+        self.tracker = GameTracker(self.db)
+        await self.tracker.load()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmpdir.cleanup()
+
+    async def test_old_finished_game_is_written_once(self):
+        old_game = api_game(1000, ongoing=False, finished_minutes_ago=600)
+        for _ in range(3):
+            await self.tracker.observe({'1': [old_game]})
+
+        self.assertEqual(self.db.game_writes, 1)
+        self.assertNotIn(1000, self.tracker.games)
+        rows = await self.db.query("SELECT state FROM games WHERE game_id = 1000")
+        self.assertEqual(rows, [(GAME_FINISHED,)])
+
+    async def test_finished_ids_survive_restart(self):
+        await self.tracker.observe({'1': [api_game(1000, ongoing=False, finished_minutes_ago=600)]})
+
+        restarted = GameTracker(self.db)
+        await restarted.load()
+        await restarted.observe({'1': [api_game(1000, ongoing=False, finished_minutes_ago=600)]})
+
+        self.assertEqual(self.db.game_writes, 1)
+
+    async def test_ongoing_game_finishes_once(self):
+        await self.tracker.observe({'1': [api_game(2000, ongoing=True)]})
+        await self.tracker.observe({'1': [api_game(2000, ongoing=False)]})
+        await self.tracker.observe({'1': [api_game(2000, ongoing=False)]})
+
+        self.assertEqual(self.db.game_writes, 2)
+        self.assertEqual([game.game_id for game in self.tracker.recent_finished()], [2000])
+
+    async def test_finished_ids_are_bounded(self):
+        tracker = GameTracker(self.db, finished_ids_max=2)
+        for game_id in (1, 2, 3):
+            await tracker.observe({'1': [api_game(game_id, ongoing=False, finished_minutes_ago=600)]})
+
+        self.assertEqual(list(tracker.finished_ids), [2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
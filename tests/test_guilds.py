@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import RANK_CHANNEL_ID
+from database import AOE4Database
+from guilds import GuildConfigStore
+
+GUILD_ID = 42
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+class FakeChannel:
+    def __init__(self, guild):
+        self.guild = guild
+
+class FakeBot:
+    def __init__(self, channels):
+        self.channels = channels
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+class AdoptLegacyGuildTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = AOE4Database(os.path.join(self.tmpdir.name, 'players.db'))
+        self.store = GuildConfigStore(self.db)
+        await self.store.load()
+        self.bot = FakeBot({RANK_CHANNEL_ID: FakeChannel(FakeGuild(GUILD_ID))})
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self.tmpdir.cleanup()
+
+    async def add_player(self, guild_id, discord_id, ingame_id, rank_level="gold_1"):
+        await self.db.execute(
+            "INSERT INTO players (guild_id, discord_id, ingame_id, ingame_name, rank_level, is_main) "
+            "VALUES (?, ?, ?, ?, ?, 1)",
+            (guild_id, discord_id, ingame_id, f"name{ingame_id}", rank_level)
+        )
+
+    async def players(self):
+        return await self.db.query(
+            "SELECT guild_id, discord_id, ingame_id, rank_level FROM players ORDER BY discord_id, ingame_id"
+        )
+
+    async def test_adopts_legacy_rows(self):
+        await self.add_player(0, 1, "100")
+        await self.add_player(0, 2, "200")
+
+        await self.store.adopt_legacy_guild(self.bot)
+
+        self.assertEqual(await self.players(), [(GUILD_ID, 1, "100", "gold_1"), (GUILD_ID, 2, "200", "gold_1")])
+        self.assertIsNotNone(self.store.get(GUILD_ID))
+
+    async def test_conflicting_legacy_rows_are_dropped(self):
+        # Same registration in both, and the same account registered to another user
+        await self.add_player(0, 1, "100", rank_level="silver_1")
+        await self.add_player(GUILD_ID, 1, "100", rank_level="gold_3")
+        await self.add_player(0, 2, "200")
+        await self.add_player(GUILD_ID, 3, "200")
+        await self.add_player(0, 4, "400")
+
+        await self.store.adopt_legacy_guild(self.bot)
+
+        self.assertEqual(await self.players(), [
+            (GUILD_ID, 1, "100", "gold_3"),
+            (GUILD_ID, 3, "200", "gold_1"),
+            (GUILD_ID, 4, "400", "gold_1")
+        ])
+
+    async def test_runs_again_without_changes(self):
+        await self.add_player(0, 1, "100")
+        await self.store.adopt_legacy_guild(self.bot)
+        await self.store.adopt_legacy_guild(self.bot)
+
+        self.assertEqual(await self.players(), [(GUILD_ID, 1, "100", "gold_1")])
+
+if __name__ == '__main__':
+    unittest.main()
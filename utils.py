@@ -1,10 +1,19 @@
 import discord
-import aiohttp
+import asyncio
 import logging
+import hashlib
+import json
+import time
+from datetime import datetime
 from config import *
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_LIVE
 
 logger = logging.getLogger('AOE4RankBot')
 
+# Rank role changes Discord refused (role above the bot's, missing permission, member gone):
+# (guild_id, member_id, role_id) -> (consecutive failures, unix time of the next attempt)
+_role_failures = {}
+
 def format_rank_display(rank_level: str) -> str:
     """Format rank level for display"""
     return RANK_DISPLAY.get(rank_level.lower(), rank_level.capitalize())
@@ -13,40 +22,235 @@ def get_base_rank(rank_level: str) -> str:
     """Get the base rank from a rank level (e.g. 'gold_2' -> 'gold')"""
     return rank_level.split('_')[0].lower()
 
-async def update_player_role(guild, user_id, new_rank_level, old_rank_level=None):
-    """Update a player's rank role"""
+def parse_api_time(value):
+    """Parse an aoe4world ISO timestamp into unix seconds"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def embed_fingerprint(embed: discord.Embed) -> str:
+    """Hash an embed's content, ignoring its timestamp"""
+    data = embed.to_dict()
+    data.pop('timestamp', None)
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+def rank_role_edit(guild, member, rank_level, rank_roles):
+    """Rank roles to remove and add so a member has exactly the rank role for rank_level.
+
+    rank_roles maps base ranks to the guild's role ids.
+    Returns (remove, add, old_rank, new_rank), or None if the member already has it."""
+    role_ranks = {role_id: rank for rank, role_id in rank_roles.items()}
+    desired = guild.get_role(rank_roles.get(get_base_rank(rank_level or 'unranked'), 0))
+    current = [role for role in member.roles if role.id in role_ranks]
+    if current == ([desired] if desired else []):
+        return None
+
+    remove = [role for role in current if role != desired]
+    add = [desired] if desired and desired not in current else []
+    old_rank = role_ranks[current[0].id] if current else None
+    new_rank = role_ranks[desired.id] if desired else None
+    return remove, add, old_rank, new_rank
+
+def _note_role_failure(guild, member, roles, error, now):
+    """Back off from roles Discord refused for a member, logging only the first refusal"""
+    first_refused = []
+    for role in roles:
+        key = (guild.id, member.id, role.id)
+        failures = _role_failures.get(key, (0, 0))[0] + 1
+        delay = min(ROLE_FAILURE_BACKOFF_MINUTES * 2 ** (failures - 1), ROLE_FAILURE_BACKOFF_MAX_MINUTES)
+        _role_failures[key] = (failures, now + delay * 60)
+        if failures == 1:
+            first_refused.append(str(role.id))
+    if first_refused:
+        logger.warning(
+            f"Cannot change roles {', '.join(first_refused)} for user {member.id} in guild {guild.id}: {error}; "
+            f"retrying with backoff from {ROLE_FAILURE_BACKOFF_MINUTES} minutes"
+        )
+
+async def apply_rank_role_edit(guild, member, remove, add, reason):
+    """Swap rank roles with a single role edit, keeping the member's other roles.
+
+    Roles Discord refused for this member are left as they are until their
+    backoff ends. Returns True if the whole change was applied."""
+    now = time.time()
+    changes = [
+        role for role in remove + add
+        if _role_failures.get((guild.id, member.id, role.id), (0, 0))[1] <= now
+    ]
+    if not changes:
+        return False
+
+    # Held roles in changes are the ones to remove; the rest of changes are added
+    roles = [role for role in member.roles if not role.is_default() and role not in changes]
+    roles.extend(role for role in add if role in changes)
+    try:
+        await member.edit(roles=roles, reason=reason)
+    except (discord.Forbidden, discord.NotFound) as e:
+        # Discord does not say which role it refused, so back off from all of them
+        _note_role_failure(guild, member, changes, e, now)
+        return False
+    for role in changes:
+        _role_failures.pop((guild.id, member.id, role.id), None)
+    return len(changes) == len(remove) + len(add)
+
+async def update_player_role(guild, user_id, rank_level, rank_roles):
+    """Give a player the rank role for rank_level"""
     member = guild.get_member(user_id)
-    if not member:
+    if not member or not rank_roles:
+        return False
+
+    edit = rank_role_edit(guild, member, rank_level, rank_roles)
+    if not edit:
         return False
+    return await apply_rank_role_edit(guild, member, edit[0], edit[1], "Rank role update")
+
+async def reconcile_rank_roles(bot, guild, guild_config):
+    """Bring every registered main's rank role in a guild in line with their stored rank.
+
+    Members whose roles already match are left alone; everyone else has their
+    rank roles swapped, with at most ROLE_EDIT_CONCURRENCY members in flight.
+    Returns (member, old_rank, new_rank) for every change that was applied."""
+    if not guild_config.rank_roles:
+        return []
+    rows = await bot.db.query(
+        "SELECT discord_id, rank_level FROM players WHERE guild_id = ? AND is_main = 1",
+        (guild.id,)
+    )
+
+    edits = []
+    seen = set()
+    for discord_id, rank_level in rows:
+        if discord_id in seen:
+            continue
+        seen.add(discord_id)
+        member = guild.get_member(discord_id)
+        if not member:
+            continue
+        edit = rank_role_edit(guild, member, rank_level, guild_config.rank_roles)
+        if edit:
+            edits.append((member, *edit))
+
+    if not edits:
+        return []
 
-    # Remove old rank role if it exists
-    if old_rank_level:
-        old_base_rank = get_base_rank(old_rank_level)
-        old_role_id = RANK_ROLES.get(old_base_rank)
-        if old_role_id:
-            old_role = guild.get_role(old_role_id)
-            if old_role and old_role in member.roles:
-                await member.remove_roles(old_role)
-
-    # Add new rank role
-    new_base_rank = get_base_rank(new_rank_level)
-    new_role_id = RANK_ROLES.get(new_base_rank)
-    if new_role_id:
-        new_role = guild.get_role(new_role_id)
-        if new_role and new_role not in member.roles:
-            await member.add_roles(new_role)
-            return True
-    return False
-
-async def fetch_player_data(ingame_id):
+    semaphore = asyncio.Semaphore(ROLE_EDIT_CONCURRENCY)
+
+    async def apply(member, remove, add):
+        async with semaphore:
+            return await apply_rank_role_edit(guild, member, remove, add, "Rank role reconciliation")
+
+    results = await asyncio.gather(
+        *(apply(member, remove, add) for member, remove, add, _, _ in edits),
+        return_exceptions=True
+    )
+
+    applied = []
+    failed = 0
+    for (member, _, _, old_rank, new_rank), result in zip(edits, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error updating rank role for user {member.id}: {result}")
+        if result is True:
+            applied.append((member, old_rank, new_rank))
+        else:
+            failed += 1
+
+    logger.info(
+        f"Rank role reconciliation in guild {guild.id}: "
+        f"{len(applied)} updated, {failed} failed or backing off, {len(seen)} mains checked"
+    )
+    return applied
+
+async def fetch_player_data(bot, ingame_id, priority=PRIORITY_BACKGROUND):
     """Fetch player data from aoe4world.com API"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{API_BASE_URL}{ingame_id}.json") as response:
-                if response.status == 200:
-                    return await response.json()
-                logger.warning(f"Failed to fetch data for {ingame_id}: HTTP {response.status}")
-                return None
+        status, data = await bot.api_scheduler.get_json(f"{API_BASE_URL}{ingame_id}.json", priority=priority)
+        if status == 200:
+            return data
+        logger.warning(f"Failed to fetch data for {ingame_id}: HTTP {status}")
+        return None
     except Exception as e:
         logger.error(f"Error fetching player data: {e}")
+        return None
+
+async def get_player_data(bot, ingame_id, allow_stale=True, priority=PRIORITY_BACKGROUND):
+    """Get player data through the shared profile cache.
+
+    With allow_stale, an expired profile is returned immediately and refreshed in the background."""
+    return await bot.profile_cache.get(
+        ingame_id,
+        lambda key: fetch_player_data(bot, key, priority),
+        allow_stale=allow_stale
+    )
+
+def split_games_by_player(games, ingame_ids):
+    """Assign each game to the requested players who took part in it.
+
+    Games keep the API order (most recent first) within each player's list."""
+    wanted = {str(ingame_id) for ingame_id in ingame_ids}
+    games_by_player = {str(ingame_id): [] for ingame_id in ingame_ids}
+    for game in games:
+        for team in game.get('teams', []):
+            for player in team:
+                profile_id = str(player.get('player', {}).get('profile_id'))
+                if profile_id in wanted:
+                    games_by_player[profile_id].append(game)
+    return games_by_player
+
+async def fetch_games_page(bot, ingame_ids):
+    """Fetch the first page of several players' combined games (most recent first).
+
+    Returns (ingame_id -> games, whether the page was full), or None if the request failed."""
+    params = {'profile_ids': ','.join(str(ingame_id) for ingame_id in ingame_ids)}
+    status, data = await bot.api_scheduler.get_json(GAMES_API_URL, params=params, priority=PRIORITY_LIVE)
+    if status != 200:
+        logger.warning(f"Failed to fetch games for {len(ingame_ids)} players: HTTP {status}")
+        return None
+    games = data.get('games', [])
+    return split_games_by_player(games, ingame_ids), len(games) >= data.get('per_page', GAMES_PAGE_SIZE)
+
+async def fetch_games_batch(bot, ingame_ids, semaphore=None):
+    """Fetch recent games for several players with as few games queries as possible.
+
+    A full page can leave out players who have not played lately, so those are
+    queried again as a smaller batch, and after LIVE_TRACKER_BATCH_ROUNDS
+    rounds one by one. Every query holds the semaphore, which bounds requests
+    in flight across batches. Returns a dict of ingame_id -> games, or None if
+    the first request failed; players whose follow-up query failed are left out."""
+    semaphore = semaphore or asyncio.Semaphore(LIVE_TRACKER_CONCURRENCY)
+
+    async def fetch_page(page_ids):
+        async with semaphore:
+            return await fetch_games_page(bot, page_ids)
+
+    try:
+        result = await fetch_page(ingame_ids)
+        if result is None:
+            return None
+        games_by_player, full = result
+
+        for _ in range(LIVE_TRACKER_BATCH_ROUNDS):
+            missing = [ingame_id for ingame_id, games in games_by_player.items() if not games]
+            if not missing or not full:
+                # A page that is not full holds every game of the players queried
+                return games_by_player
+            result = await fetch_page(missing)
+            if result is None:
+                return {ingame_id: games for ingame_id, games in games_by_player.items() if games}
+            round_games, full = result
+            games_by_player.update(round_games)
+
+        missing = [ingame_id for ingame_id, games in games_by_player.items() if not games]
+        if missing and full:
+            results = await asyncio.gather(*(fetch_page([ingame_id]) for ingame_id in missing))
+            for ingame_id, result in zip(missing, results):
+                if result is None:
+                    del games_by_player[ingame_id]
+                else:
+                    games_by_player.update(result[0])
+        return games_by_player
+    except Exception as e:
+        logger.error(f"Error fetching games batch: {e}")
         return None
\ No newline at end of file